@@ -12,34 +12,127 @@ develop a new k8s charm using the Operator Framework:
     https://discourse.charmhub.io/t/4208
 """
 
+import functools
+import hashlib
+import ipaddress
+import json
 import logging
+import math
 import os
 import pathlib
+import re
 from base64 import b64decode
 from binascii import Error as Base64Error
-from typing import Any, Dict, Optional
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
 
 import yaml
 from charmhelpers.core import hookenv
 from charmhelpers.fetch import snap
-from ops.charm import CharmBase, ConfigChangedEvent, InstallEvent
+from ops.charm import (
+    ActionEvent,
+    CharmBase,
+    ConfigChangedEvent,
+    InstallEvent,
+    LeaderElectedEvent,
+    RelationChangedEvent,
+    RelationCreatedEvent,
+    UpdateStatusEvent,
+)
+from ops.framework import StoredState
 from ops.main import main
-from ops.model import ActiveStatus, BlockedStatus, MaintenanceStatus, ModelError
+from ops.model import (
+    ActiveStatus,
+    BlockedStatus,
+    MaintenanceStatus,
+    ModelError,
+    Relation,
+)
 from prometheus_interface.operator import (
     PrometheusConfigError,
     PrometheusConnected,
     PrometheusScrapeTarget,
 )
 
-from exporter import ExporterConfigError, ExporterSnap
+from exporter import ExporterConfigError, ExporterScrapeError, ExporterSnap, option_path
+from hook_timing import HookTimer, render_textfile
+from rolling_restart import RollingRestart
+
+try:
+    # Bindings to libyaml are much faster than pure-python implementation
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:  # pragma: no cover
+    from yaml import SafeLoader as YamlLoader  # type: ignore
 
 # Log messages can be retrieved using juju debug-log
 logger = logging.getLogger(__name__)
 
 
+def timed_handler(handler: Callable[[Any, Any], None]) -> Callable[[Any, Any], None]:
+    """Measure duration of the decorated event handler and record it in charm's state."""
+
+    @functools.wraps(handler)
+    def wrapper(charm: "PrometheusJujuExporterCharm", event: Any) -> None:
+        charm.hook_timer = HookTimer(handler.__name__)
+        try:
+            handler(charm, event)
+        finally:
+            charm.hook_timer.stop()
+            charm.record_hook_timing(charm.hook_timer)
+            charm.hook_timer = None
+
+    return wrapper
+
+
+def rank_controller_endpoints(endpoints: List[str], local_addresses: List[str]) -> List[str]:
+    """Sort controller endpoints so that the ones on the local host come first.
+
+    Loopback endpoints are preferred the most, followed by endpoints that use one of the
+    :local_addresses and then by all remaining endpoints. Original order is kept within each
+    of these groups.
+
+    :param endpoints: Controller API endpoints in format <IP>:<PORT>
+    :param local_addresses: IP addresses that belong to the local host.
+    """
+
+    def _rank(endpoint: str) -> int:
+        host = endpoint.rpartition(":")[0].strip("[]")
+        if host == "localhost":
+            return 0
+        try:
+            if ipaddress.ip_address(host).is_loopback:
+                return 0
+        except ValueError:
+            pass  # Endpoint uses hostname instead of IP
+
+        return 1 if host in local_addresses else 2
+
+    return sorted(endpoints, key=_rank)
+
+
 class PrometheusJujuExporterCharm(CharmBase):
     """Charm the service."""
 
+    _stored = StoredState()
+
+    PEER_RELATION = "exporter-peers"
+
+    # Number of the most recent handler executions for which timings are kept
+    HOOK_TIMINGS_LIMIT = 50
+
+    # Supported values of 'io-scheduling-class' option
+    IO_SCHEDULING_CLASSES = ["idle", "best-effort", "realtime"]
+
+    # How long (in seconds) to wait for restarted exporter to serve fresh data during rolling
+    # restart, before the restart is considered failed
+    RESTART_READY_TIMEOUT = 300
+
+    # Safety margin applied to measured durations when scrape parameters are tuned automatically
+    SCRAPE_SAFETY_FACTOR = 3
+
+    # Minimal timeout (in seconds) of the scrape that measures exporter's performance
+    MEASURE_SCRAPE_TIMEOUT = 300
+
     # Mapping between charm and snap configuration options
     SNAP_CONFIG_MAP = {
         "organization": "customer.name",
@@ -49,21 +142,97 @@ class PrometheusJujuExporterCharm(CharmBase):
         "juju-password": "juju.password",
         "scrape-interval": "exporter.collect_interval",
         "scrape-port": "exporter.port",
+        "scrape-max-connections": "exporter.max_connections",
+        "query-api": "exporter.query_api.enabled",
+        "query-api-max-page-size": "exporter.query_api.max_page_size",
+        "collect-mode": "exporter.collect_mode",
+        "collect-cache-ttl": "exporter.cache_ttl",
+        "metadata-refresh-interval": "exporter.metadata_refresh_interval",
+        "state-transition-metrics": "exporter.state_transitions",
+        "remote-write-url": "exporter.remote_write.url",
+        "remote-write-batch-size": "exporter.remote_write.batch_size",
+        "remote-write-queue-size": "exporter.remote_write.queue_size",
+        "remote-write-max-retries": "exporter.remote_write.max_retries",
+        "trace-sample-rate": "exporter.tracing.sample_rate",
+        "trace-format": "exporter.tracing.format",
+        "trace-max-file-size": "exporter.tracing.max_file_size",
+        "trace-retention": "exporter.tracing.max_files",
+        "units-collector": "collectors.units.enabled",
+        "units-collector-interval": "collectors.units.interval",
+        "units-collector-budget": "collectors.units.budget",
+        "applications-collector": "collectors.applications.enabled",
+        "applications-collector-interval": "collectors.applications.interval",
+        "applications-collector-budget": "collectors.applications.budget",
+        "relations-collector": "collectors.relations.enabled",
+        "relations-collector-interval": "collectors.relations.interval",
+        "relations-collector-budget": "collectors.relations.budget",
+        "cpu-quota": "exporter.cpu_quota",
+        "api-rate-limit": "juju.rate_limit",
+        "api-max-in-flight": "juju.max_in_flight",
+        "api-adaptive-backoff": "juju.adaptive_backoff",
+        "model-discovery": "juju.model_discovery",
+        "model-list-interval": "juju.model_list_interval",
+        "skip-unavailable-models": "juju.skip_unavailable_models",
     }
+    # SNAP_CONFIG_MAP with snap options split into path of parent sections and option name
+    _SNAP_CONFIG_PATHS = [
+        (charm_option, option_path(snap_option)[:-1], option_path(snap_option)[-1])
+        for charm_option, snap_option in SNAP_CONFIG_MAP.items()
+    ]
+
+    # Sections of snap config that are rendered only if the charm option that enables them is set
+    OPTIONAL_SECTIONS = {
+        "exporter.remote_write": "remote-write-url",
+        "exporter.tracing": "trace-sample-rate",
+        "collectors.units": "units-collector",
+        "collectors.applications": "applications-collector",
+        "collectors.relations": "relations-collector",
+    }
+    # OPTIONAL_SECTIONS with sections split into their paths
+    _OPTIONAL_SECTION_PATHS = {
+        option_path(section): charm_option for section, charm_option in OPTIONAL_SECTIONS.items()
+    }
+
+    # Values from agent.conf that are used by the charm
+    AGENT_CONF_KEYS = ["cacert", "apiaddresses"]
 
     def __init__(self, *args: Any) -> None:
         """Initialize charm."""
         super().__init__(*args)
         self.exporter = ExporterSnap()
         self.prometheus_target = PrometheusScrapeTarget(self, "prometheus-scrape")
+        self.prometheus_summary_target = PrometheusScrapeTarget(self, "prometheus-summary-scrape")
         self._snap_path: Optional[str] = None
         self._snap_path_set = False
+        self.hook_timer: Optional[HookTimer] = None
+        self._stored.set_default(
+            render_seconds=None,
+            collect_seconds=None,
+            replication_upstream=None,
+            hook_timings="[]",
+            agent_conf_key=None,
+            agent_conf="{}",
+            applied_config_hash=None,
+        )
 
         self.framework.observe(self.on.config_changed, self._on_config_changed)
         self.framework.observe(self.on.install, self._on_install)
+        self.framework.observe(self.on.update_status, self._on_update_status)
+        self.framework.observe(self.on.leader_elected, self._on_leader_elected)
+        self.framework.observe(
+            self.on[self.PEER_RELATION].relation_created, self._on_peer_relation_created
+        )
+        self.framework.observe(
+            self.on[self.PEER_RELATION].relation_changed, self._on_peer_relation_changed
+        )
         self.framework.observe(
             self.prometheus_target.on.prometheus_available, self._on_prometheus_available
         )
+        self.framework.observe(
+            self.prometheus_summary_target.on.prometheus_available,
+            self._on_prometheus_summary_available,
+        )
+        self.framework.observe(self.on.show_hook_timings_action, self._on_show_hook_timings_action)
 
     @property
     def snap_path(self) -> Optional[str]:
@@ -86,6 +255,120 @@ class PrometheusJujuExporterCharm(CharmBase):
 
         return self._snap_path
 
+    @property
+    def hook_timings(self) -> List[Dict[str, Any]]:
+        """Get timings of the most recent event handler executions, ordered from the oldest."""
+        return json.loads(self._stored.hook_timings)
+
+    def record_hook_timing(self, timer: HookTimer) -> None:
+        """Persist timing of the event handler execution.
+
+        Only the last HOOK_TIMINGS_LIMIT records are kept. If 'hook-timings-textfile' is enabled,
+        timings are also exported in the Prometheus text format for the exporter to expose.
+        """
+        timings = self.hook_timings
+        timings.append(timer.as_dict())
+        limit = self.HOOK_TIMINGS_LIMIT
+        timings = timings[-limit:]
+        self._stored.hook_timings = json.dumps(timings)
+        logger.debug("Handler %s finished in %.3fs.", timer.handler, timer.duration)
+
+        if self.config["hook-timings-textfile"]:
+            try:
+                self.exporter.write_textfile(render_textfile(timings))
+            except OSError as exc:
+                logger.warning("Failed to write hook timings textfile: %s", exc)
+
+    @contextmanager
+    def timed_phase(self, name: str) -> Iterator[None]:
+        """Measure duration of a named phase of the currently executed event handler."""
+        if self.hook_timer is None:
+            yield
+            return
+
+        with self.hook_timer.phase(name):
+            yield
+
+    @property
+    def peer_relation(self) -> Optional[Relation]:
+        """Get peer relation shared by all units of this application, if it already exists."""
+        return self.model.get_relation(self.PEER_RELATION)
+
+    @property
+    def _replication_upstream(self) -> Optional[str]:
+        """Get URL of the exporter on the leader unit from which standby units replicate data.
+
+        Returns None if the leader did not publish its address yet.
+        """
+        relation = self.peer_relation
+        if relation is None:
+            return None
+
+        leader_address = relation.data[self.app].get("leader-address")
+        if not leader_address:
+            return None
+
+        return f"http://{leader_address}:{self.config['scrape-port']}"
+
+    @property
+    def _rolling_restart(self) -> Optional[RollingRestart]:
+        """Get coordinator of exporter restarts if they should be coordinated with other units."""
+        relation = self.peer_relation
+        if int(self.config["restart-batch-size"]) <= 0 or relation is None or not relation.units:
+            return None
+
+        return RollingRestart(relation, self.unit, self.app)
+
+    @property
+    def collect_on_demand(self) -> bool:
+        """Return True if exporter collects data on scrape requests instead of a timer."""
+        return self.config["collect-mode"] == "on-demand"
+
+    @property
+    def scrape_timeout(self) -> int:
+        """Get timeout (in seconds) for Prometheus scrape requests.
+
+        Configured 'scrape-timeout' is used unless 'scrape-auto-tune' is enabled and the charm
+        already measured how long it takes exporter to render metrics. In that case, timeout is
+        set to a safe multiple of the measured duration, but never lower than the configured one.
+
+        In 'on-demand' collection mode, the scrape may need to wait for the whole data collection,
+        so the timeout always accommodates the duration of the last collection (and rendering of
+        the metrics, if it was measured before). Until the collection is measured, scrape is
+        allowed to take the whole configured 'scrape-interval'.
+        """
+        timeout = int(self.config["scrape-timeout"])
+        render_seconds = self._stored.render_seconds
+        if self.collect_on_demand:
+            collect_seconds = self._stored.collect_seconds
+            if collect_seconds is None:
+                return max(timeout, int(self.config["scrape-interval"]) * 60)
+
+            expected_duration = collect_seconds + (render_seconds or 0)
+            return max(timeout, math.ceil(expected_duration * self.SCRAPE_SAFETY_FACTOR))
+
+        if self.config["scrape-auto-tune"] and render_seconds is not None:
+            timeout = max(timeout, math.ceil(render_seconds * self.SCRAPE_SAFETY_FACTOR))
+
+        return timeout
+
+    @property
+    def scrape_interval(self) -> int:
+        """Get interval (in minutes) for exporter data collection and Prometheus scrapes.
+
+        Configured 'scrape-interval' is used unless 'scrape-auto-tune' is enabled and exporter
+        reports duration of its data collection. In that case, the shortest interval that safely
+        accommodates the collection is used, with configured 'scrape-interval' as an upper
+        limit. Interval is never shorter than the scrape timeout.
+        """
+        interval = int(self.config["scrape-interval"])
+        collect_seconds = self._stored.collect_seconds
+        if self.config["scrape-auto-tune"] and collect_seconds is not None:
+            safe_interval = math.ceil(collect_seconds * self.SCRAPE_SAFETY_FACTOR / 60)
+            interval = min(interval, max(1, safe_interval))
+
+        return max(interval, math.ceil(self.scrape_timeout / 60))
+
     def get_controller_ca(self) -> str:
         """Get CA certificate used by targeted Juju controller.
 
@@ -105,44 +388,176 @@ class PrometheusJujuExporterCharm(CharmBase):
                 )
                 raise RuntimeError("Invalid base64 value in 'controller-ca' option.") from exc
 
-        agent_conf_path = pathlib.Path(hookenv.charm_dir()).joinpath("../agent.conf")
-        with open(agent_conf_path, "r", encoding="utf-8") as conf_file:
-            agent_conf = yaml.safe_load(conf_file)
-
-        ca_cert = agent_conf.get("cacert")
+        ca_cert = self.load_agent_conf().get("cacert")
         if not ca_cert:
             raise RuntimeError("Charm failed to fetch controller's CA certificate.")
 
         return ca_cert
 
-    def generate_exporter_config(self) -> Dict[str, Any]:
-        """Generate exporter service config based on the values from charm config."""
+    def load_agent_conf(self) -> Dict[str, Any]:
+        """Load configuration of the juju agent that runs this unit.
+
+        Only values listed in AGENT_CONF_KEYS are loaded. They are cached in charm's state and
+        agent.conf is parsed again only when its inode or modification time changes.
+        """
+        agent_conf_path = pathlib.Path(hookenv.charm_dir()).joinpath("../agent.conf")
+        agent_conf_stat = os.stat(agent_conf_path)
+        cache_key = f"{agent_conf_stat.st_ino}:{agent_conf_stat.st_mtime_ns}"
+        if cache_key != self._stored.agent_conf_key:
+            logger.debug("Parsing %s.", agent_conf_path)
+            with open(agent_conf_path, "r", encoding="utf-8") as conf_file:
+                agent_conf = yaml.load(conf_file, Loader=YamlLoader) or {}
+            self._stored.agent_conf = json.dumps(
+                {key: agent_conf[key] for key in self.AGENT_CONF_KEYS if key in agent_conf}
+            )
+            self._stored.agent_conf_key = cache_key
+
+        return json.loads(self._stored.agent_conf)
+
+    def _get_controller_endpoints(self) -> List[str]:
+        """Get API endpoints of the controller that deploys this unit, local ones first.
+
+        Endpoints are discovered from the configuration of the juju agent that runs this unit.
+        """
+        endpoints = self.load_agent_conf().get("apiaddresses")
+        if not endpoints:
+            raise RuntimeError("Charm failed to discover controller's API endpoints.")
+
+        local_addresses = [hookenv.unit_private_ip(), hookenv.unit_public_ip()]
+        return rank_controller_endpoints(endpoints, local_addresses)
+
+    def map_charm_options(self) -> Dict[str, Any]:
+        """Transform charm options into nested snap options according to SNAP_CONFIG_MAP.
+
+        Sections listed in OPTIONAL_SECTIONS are omitted if they are not enabled.
+        """
         exporter_config: Dict[str, Any] = {}
-        # transform charm config into snaps' configuration file
-        for charm_option, snap_option in self.SNAP_CONFIG_MAP.items():
+        for charm_option, section_path, option_name in self._SNAP_CONFIG_PATHS:
             value = self.config[charm_option]
-            if not value:
+            # Unset options are omitted, boolean options are always passed explicitly
+            if not value and not isinstance(value, bool):
                 continue
 
-            # Parse dot-separated snap config name and inject value to the final config
-            option_id = snap_option.split(".")
-            option_path = option_id[:-1]
-            option_name = option_id[-1]
+            # Options of optional sections are omitted unless the section is enabled
+            enabling_option = self._OPTIONAL_SECTION_PATHS.get(section_path)
+            if enabling_option and not self.config[enabling_option]:
+                continue
+
+            # Inject value to its (possibly nested) section of the final config
             slice_ = exporter_config
-            for identifier in option_path:
-                if identifier not in slice_:
-                    slice_[identifier] = {}
-                slice_ = slice_[identifier]
+            for identifier in section_path:
+                slice_ = slice_.setdefault(identifier, {})
             slice_[option_name] = value
 
-        # inject CA certificate that's automatically detected by charm
+        return exporter_config
+
+    def generate_exporter_config(self) -> Dict[str, Any]:
+        """Generate exporter service config based on the values from charm config."""
+        # transform charm config into snaps' configuration file
+        exporter_config = self.map_charm_options()
+
+        # collection interval might be automatically tuned
+        if self.config["scrape-auto-tune"] and "collect_interval" in exporter_config.get(
+            "exporter", {}
+        ):
+            exporter_config["exporter"]["collect_interval"] = self.scrape_interval
+
         if "juju" not in exporter_config:
             exporter_config["juju"] = {}
 
-        exporter_config["juju"]["controller_cacert"] = self.get_controller_ca()
+        # discover endpoints of the controller that deploys this unit
+        if self.config["controller-url"] == "auto":
+            with self.timed_phase("discover_endpoints"):
+                endpoints = self._get_controller_endpoints()
+            exporter_config["juju"]["controller_endpoint"] = endpoints[0]
+            exporter_config["juju"]["controller_endpoints"] = endpoints
+
+        # inject CA certificate that's automatically detected by charm
+        with self.timed_phase("load_ca"):
+            exporter_config["juju"]["controller_cacert"] = self.get_controller_ca()
+
+        if self.config["hook-timings-textfile"]:
+            exporter_options = exporter_config.setdefault("exporter", {})
+            exporter_options["textfile_path"] = self.exporter.TEXTFILE_PATH
+
+        if self.config["trace-sample-rate"]:
+            exporter_config["exporter"]["tracing"]["path"] = self.exporter.TRACES_PATH
+
+        if self.config["leader-only-collection"]:
+            exporter_config["replication"] = self._generate_replication_config()
 
         return exporter_config
 
+    def generate_resource_limits(self) -> Dict[str, str]:
+        """Generate systemd directives that limit resources available to the exporter service.
+
+        :raises:
+            ExporterConfigError: If configured resource limits are not valid.
+        """
+        errors = ""
+        limits = {}
+
+        cpu_quota = int(self.config["cpu-quota"])
+        if cpu_quota < 0:
+            errors += f"Configuration option 'cpu-quota' must not be negative.{os.linesep}"
+        elif cpu_quota:
+            limits["CPUQuota"] = f"{cpu_quota}%"
+
+        nice_level = int(self.config["nice-level"])
+        if not -20 <= nice_level <= 19:
+            errors += f"Configuration option 'nice-level' must be between -20 and 19.{os.linesep}"
+        elif nice_level:
+            limits["Nice"] = str(nice_level)
+
+        io_class = str(self.config["io-scheduling-class"])
+        if io_class and io_class not in self.IO_SCHEDULING_CLASSES:
+            allowed = ", ".join(self.IO_SCHEDULING_CLASSES)
+            errors += (
+                f"Configuration option 'io-scheduling-class' must be one of: {allowed}."
+                f"{os.linesep}"
+            )
+        elif io_class:
+            limits["IOSchedulingClass"] = io_class
+
+        memory_max = str(self.config["memory-max"])
+        if memory_max and not re.fullmatch(r"\d+[KMGT]?|\d+%", memory_max):
+            errors += f"Configuration option 'memory-max' has invalid format.{os.linesep}"
+        elif memory_max:
+            limits["MemoryMax"] = memory_max
+
+        if errors:
+            raise ExporterConfigError(errors)
+
+        return limits
+
+    def _generate_replication_config(self) -> Dict[str, Any]:
+        """Generate exporter config for leader-only data collection.
+
+        Leader unit collects data from the controller while standby units replicate snapshots
+        of collected data from the leader.
+        """
+        if self.unit.is_leader():
+            # Forget the old upstream, so that this unit follows the next leader
+            self._stored.replication_upstream = None
+            return {"role": "leader"}
+
+        replication_config = {"role": "standby"}
+        upstream = self._replication_upstream
+        if upstream:
+            replication_config["upstream"] = upstream
+        else:
+            logger.warning("Leader unit did not publish its address yet.")
+
+        return replication_config
+
+    def _publish_leader_address(self) -> None:
+        """Publish address of this (leader) unit so that standby units can replicate from it."""
+        relation = self.peer_relation
+        if relation is None or not self.unit.is_leader():
+            return
+
+        relation.data[self.app]["leader-address"] = hookenv.unit_private_ip()
+
     def reconfigure_scrape_target(self) -> None:
         """Update scrape target configuration in related Prometheus application.
 
@@ -150,9 +565,8 @@ class PrometheusJujuExporterCharm(CharmBase):
         'prometheus-scrape'.
         """
         port = self.config["scrape-port"]
-        interval_minutes = self.config["scrape-interval"]
-        interval = interval_minutes * 60
-        timeout = self.config["scrape-timeout"]
+        interval = self.scrape_interval * 60
+        timeout = self.scrape_timeout
         try:
             self.prometheus_target.expose_scrape_target(
                 port, "/metrics", scrape_interval=f"{interval}s", scrape_timeout=f"{timeout}s"
@@ -161,6 +575,33 @@ class PrometheusJujuExporterCharm(CharmBase):
             logger.error("Failed to configure prometheus scrape target: %s", exc)
             raise exc
 
+    def reconfigure_summary_scrape_target(self) -> None:
+        """Update summary scrape target configuration in related Prometheus application.
+
+        Summary endpoint provides only cheap rollups and exporter's self-metrics, so it can be
+        scraped much more often than the full per-machine data.
+
+        Note: this function has no effect if there's no application related via
+        'prometheus-summary-scrape' or if 'summary-scrape-interval' is not valid.
+        """
+        port = self.config["scrape-port"]
+        interval = int(self.config["summary-scrape-interval"])
+        if interval <= 0:
+            logger.error("Invalid 'summary-scrape-interval', not updating summary scrape target.")
+            return
+
+        timeout = min(self.scrape_timeout, interval)
+        try:
+            self.prometheus_summary_target.expose_scrape_target(
+                port,
+                "/metrics/summary",
+                scrape_interval=f"{interval}s",
+                scrape_timeout=f"{timeout}s",
+            )
+        except PrometheusConfigError as exc:
+            logger.error("Failed to configure prometheus summary scrape target: %s", exc)
+            raise exc
+
     def reconfigure_open_ports(self) -> None:
         """Update ports that juju shows as 'opened' in units' status."""
         new_port = self.config["scrape-port"]
@@ -173,40 +614,258 @@ class PrometheusJujuExporterCharm(CharmBase):
         logger.debug("Setting port %s as opened.", new_port)
         hookenv.open_port(new_port)
 
+    @timed_handler
     def _on_install(self, _: InstallEvent) -> None:
         """Install prometheus-juju-exporter snap."""
         self.unit.status = MaintenanceStatus("Installing charm software.")
         try:
-            self.exporter.install(self.snap_path)
+            with self.timed_phase("snap_install"):
+                self.exporter.install(self.snap_path)
         except snap.CouldNotAcquireLockException as exc:
             install_source = "local resource" if self.snap_path else "snap store"
             logger.error("Failed to install %s from %s.", self.exporter.SNAP_NAME, install_source)
             raise exc
 
-    def _on_config_changed(self, _: ConfigChangedEvent) -> None:
-        """Handle changed configuration."""
+    def configure_exporter(self) -> None:
+        """Apply current charm configuration to the exporter and related applications.
+
+        If rolling restarts are enabled, new configuration is only validated and this unit
+        requests its turn to restart the exporter. Configuration is then applied once the leader
+        grants the restart. Related applications and unit's status are updated right away.
+        """
         logger.info("Processing new charm configuration.")
-        exporter_config = self.generate_exporter_config()
+        if int(self.config["summary-scrape-interval"]) <= 0:
+            self._block_on_config_error(
+                ExporterConfigError(
+                    "Configuration option 'summary-scrape-interval' must be a positive number."
+                )
+            )
+            return
+
+        with self.timed_phase("generate_config"):
+            exporter_config = self.generate_exporter_config()
+
+        rolling_restart = self._rolling_restart
+        if rolling_restart is None:
+            self.apply_exporter_config(exporter_config)
+            return
+
         try:
-            self.exporter.apply_config(exporter_config)
+            self.exporter.validate_config(exporter_config)
+            resource_limits = self.generate_resource_limits()
         except ExporterConfigError as exc:
-            # Replace snap config names with their charm equivalents
-            err_msg = str(exc)
-            for charm_option, snap_option in self.SNAP_CONFIG_MAP.items():
-                err_msg = err_msg.replace(snap_option, charm_option)
-
-            logger.error(err_msg)
-            self.unit.status = BlockedStatus("Invalid configuration. Please see logs.")
+            self._block_on_config_error(exc)
             return
 
-        self.reconfigure_scrape_target()
-        self.reconfigure_open_ports()
+        # Restart is needed if either exporter config or its resource limits changed
+        token = self.config_digest(self.exporter.render_config(exporter_config), resource_limits)
+        restart_pending = rolling_restart.request(token)
+        self._reconfigure_endpoints()
+        if restart_pending:
+            self.unit.status = MaintenanceStatus("Waiting for rolling restart.")
+        else:
+            self.unit.status = ActiveStatus("Unit is ready")
+
+        self._continue_rolling_restart(rolling_restart)
+
+    @staticmethod
+    def config_digest(
+        rendered_config: str, resource_limits: Optional[Dict[str, str]] = None
+    ) -> str:
+        """Get digest that identifies rendered exporter config and resource limits, if any."""
+        digest = hashlib.sha256(rendered_config.encode("utf-8"))
+        if resource_limits:
+            digest.update(json.dumps(resource_limits, sort_keys=True).encode("utf-8"))
+
+        return digest.hexdigest()
+
+    def apply_exporter_config(self, exporter_config: Dict[str, Any]) -> bool:
+        """Apply config to the exporter service and reconfigure related applications.
+
+        Exporter is restarted only if the rendered config or resource limits differ from the ones
+        that were last applied.
+
+        :return: True if the config was applied, False if it was invalid.
+        """
+        rendered_config = self.exporter.render_config(exporter_config)
+        config_hash = self.config_digest(rendered_config)
+        try:
+            with self.timed_phase("resource_limits"):
+                resources_changed = self.exporter.configure_resources(
+                    self.generate_resource_limits()
+                )
+            if resources_changed or config_hash != self._stored.applied_config_hash:
+                # Failed attempt leaves exporter stopped, next attempt must not be skipped
+                self._stored.applied_config_hash = None
+                with self.timed_phase("apply_config"):
+                    self.exporter.apply_config(exporter_config, rendered_config)
+                self._stored.applied_config_hash = config_hash
+            else:
+                logger.info("Exporter configuration did not change, skipping restart.")
+        except ExporterConfigError as exc:
+            self._block_on_config_error(exc)
+            return False
+
+        self._reconfigure_endpoints()
         self.unit.status = ActiveStatus("Unit is ready")
+        return True
+
+    def _reconfigure_endpoints(self) -> None:
+        """Update scrape targets and opened ports according to the current configuration."""
+        with self.timed_phase("scrape_target"):
+            self.reconfigure_scrape_target()
+            self.reconfigure_summary_scrape_target()
+        with self.timed_phase("open_ports"):
+            self.reconfigure_open_ports()
+
+    def _block_on_config_error(self, exc: ExporterConfigError) -> None:
+        """Log invalid configuration and set unit to blocked state."""
+        # Replace snap config names with their charm equivalents
+        err_msg = str(exc)
+        for charm_option, snap_option in self.SNAP_CONFIG_MAP.items():
+            err_msg = err_msg.replace(snap_option, charm_option)
+
+        logger.error(err_msg)
+        self.unit.status = BlockedStatus("Invalid configuration. Please see logs.")
+
+    def _continue_rolling_restart(self, rolling_restart: RollingRestart) -> None:
+        """Grant restarts to the next batch of units and restart exporter if it's granted to us.
+
+        Note: the hook waits (up to RESTART_READY_TIMEOUT seconds) until the restarted exporter
+        serves fresh data. If the restart fails, the unit is blocked and releases its grant, so
+        that the leader can proceed with the next batch.
+        """
+        batch_size = int(self.config["restart-batch-size"])
+        rolling_restart.update_grants(batch_size)
+        token = rolling_restart.granted_restart()
+        if token is None:
+            return
+
+        ready = False
+        if self.apply_exporter_config(self.generate_exporter_config()):
+            with self.timed_phase("wait_for_snapshot"):
+                ready = self.exporter.wait_for_snapshot(
+                    int(self.config["scrape-port"]), self.RESTART_READY_TIMEOUT
+                )
+            if not ready:
+                logger.error("Exporter did not serve data within %ss.", self.RESTART_READY_TIMEOUT)
+                self.unit.status = BlockedStatus("Exporter not ready after restart.")
+
+        rolling_restart.finish(token, ready)
+        rolling_restart.update_grants(batch_size)
+
+    @timed_handler
+    def _on_config_changed(self, _: ConfigChangedEvent) -> None:
+        """Handle changed configuration."""
+        self.configure_exporter()
 
+    def tune_scrape_parameters(self) -> None:
+        """Measure cost of exporter's data collection and adjust scrape parameters accordingly.
+
+        Measured values are persisted and used to calculate 'scrape_timeout' and
+        'scrape_interval'. If the exporter's collection interval changes as a result, exporter
+        service is reconfigured the same way as when charm config changes (including rolling
+        restarts). Prometheus scrape target is updated if any of the values change.
+
+        Measuring scrape is not limited by the current scrape timeout, otherwise a timeout that
+        is already too short could never be raised. In 'on-demand' collection mode, full scrape
+        would trigger data collection, so only the summary endpoint, that reports duration of the
+        last collection, is scraped. Its latency says nothing about rendering of the full metrics,
+        so only the collection duration is persisted in that case.
+        """
+        old_interval = self.scrape_interval
+        old_timeout = self.scrape_timeout
+        path = "/metrics/summary" if self.collect_on_demand else "/metrics"
+        try:
+            with self.timed_phase("measure_scrape"):
+                stats = self.exporter.measure_scrape(
+                    int(self.config["scrape-port"]),
+                    max(old_timeout, self.MEASURE_SCRAPE_TIMEOUT),
+                    path,
+                )
+        except ExporterScrapeError as exc:
+            logger.warning("Skipping automatic tuning of scrape parameters: %s", exc)
+            return
+
+        logger.debug(
+            "Exporter rendered %s in %.2fs, last collection took %ss.",
+            path,
+            stats.render_seconds,
+            stats.collect_seconds,
+        )
+        if not self.collect_on_demand:
+            self._stored.render_seconds = stats.render_seconds
+        self._stored.collect_seconds = stats.collect_seconds
+
+        if self.scrape_interval != old_interval:
+            logger.info(
+                "Adjusting exporter's collection interval from %s to %s minutes.",
+                old_interval,
+                self.scrape_interval,
+            )
+            self.configure_exporter()
+
+        if self.scrape_interval != old_interval or self.scrape_timeout != old_timeout:
+            self.reconfigure_scrape_target()
+            # Summary scrape timeout is bound by the full scrape timeout
+            self.reconfigure_summary_scrape_target()
+
+    @timed_handler
+    def _on_update_status(self, _: UpdateStatusEvent) -> None:
+        """Periodically tune scrape parameters if it's enabled or required by collection mode."""
+        if not (self.config["scrape-auto-tune"] or self.collect_on_demand):
+            return
+
+        if not isinstance(self.unit.status, ActiveStatus):
+            return
+
+        self.tune_scrape_parameters()
+
+    @timed_handler
+    def _on_leader_elected(self, _: LeaderElectedEvent) -> None:
+        """Take over data collection if this unit became a leader."""
+        self._publish_leader_address()
+        if self.config["leader-only-collection"]:
+            logger.info("Unit became leader, taking over data collection.")
+            self.configure_exporter()
+
+    @timed_handler
+    def _on_peer_relation_created(self, _: RelationCreatedEvent) -> None:
+        """Publish leader's address as soon as the peer relation is available."""
+        self._publish_leader_address()
+
+    @timed_handler
+    def _on_peer_relation_changed(self, _: RelationChangedEvent) -> None:
+        """Coordinate rolling restarts and follow changes of the replication leader."""
+        rolling_restart = self._rolling_restart
+        if rolling_restart is not None:
+            self._continue_rolling_restart(rolling_restart)
+
+        if not self.config["leader-only-collection"] or self.unit.is_leader():
+            return
+
+        upstream = self._replication_upstream
+        if upstream == self._stored.replication_upstream:
+            return
+
+        logger.info("Replicating exporter data from new leader at %s", upstream)
+        self._stored.replication_upstream = upstream
+        self.configure_exporter()
+
+    @timed_handler
     def _on_prometheus_available(self, _: PrometheusConnected) -> None:
         """Trigger configuration of a prometheus scrape target."""
         self.reconfigure_scrape_target()
 
+    @timed_handler
+    def _on_prometheus_summary_available(self, _: PrometheusConnected) -> None:
+        """Trigger configuration of a prometheus summary scrape target."""
+        self.reconfigure_summary_scrape_target()
+
+    def _on_show_hook_timings_action(self, event: ActionEvent) -> None:
+        """Show timings of the most recent event handler executions."""
+        event.set_results({"timings": yaml.safe_dump(self.hook_timings, sort_keys=False)})
+
 
 if __name__ == "__main__":  # pragma: nocover
     main(PrometheusJujuExporterCharm)
@@ -6,27 +6,70 @@
 
 Module focused on handling operations related to prometheus-juju-exporter snap.
 """
+import functools
 import logging
 import os
 import subprocess
-from typing import Any, Dict, List, Optional
+import time
+import urllib.parse
+import urllib.request
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Type, Union
 
 import yaml
 from charmhelpers.fetch import snap
 
+try:
+    # Bindings to libyaml are much faster than pure-python implementation
+    from yaml import CSafeDumper as YamlDumper
+except ImportError:  # pragma: no cover
+    from yaml import SafeDumper as YamlDumper  # type: ignore
+
 # Log messages can be retrieved using juju debug-log
 logger = logging.getLogger(__name__)
 
 
+@functools.lru_cache(maxsize=None)
+def option_path(option: str) -> Tuple[str, ...]:
+    """Split dot-separated name of the snap option into path of nested config keys."""
+    return tuple(option.split("."))
+
+
 class ExporterConfigError(Exception):
     """Indicates problem with configuration of exporter service."""
 
 
+class ExporterScrapeError(Exception):
+    """Indicates that metrics could not be fetched from the exporter service."""
+
+
+class ScrapeStats(NamedTuple):
+    """Measured cost of serving and collecting exporter data.
+
+    :param render_seconds: How long did it take exporter to respond to '/metrics' request.
+    :param collect_seconds: Duration of the last data collection as reported by the exporter
+        itself. None if the exporter does not report this information.
+    """
+
+    render_seconds: float
+    collect_seconds: Optional[float] = None
+
+
 class ExporterSnap:
     """Class that handles operations of prometheus-juju-exporter snap and related services."""
 
     SNAP_NAME = "prometheus-juju-exporter"
     SNAP_CONFIG_PATH = f"/var/snap/{SNAP_NAME}/current/config.yaml"
+    SERVICE_NAME = f"snap.{SNAP_NAME}.{SNAP_NAME}.service"
+    # Drop-in file with resource limits of the exporter service
+    SYSTEMD_DROPIN_PATH = f"/etc/systemd/system/{SERVICE_NAME}.d/50-charm-resources.conf"
+    # Textfile with additional metrics (e.g. charm hook timings) that exporter exposes
+    TEXTFILE_PATH = f"/var/snap/{SNAP_NAME}/common/charm.prom"
+    # Directory where exporter writes traces of data collections
+    TRACES_PATH = f"/var/snap/{SNAP_NAME}/common/traces"
+    # Metric present only after exporter finishes data collection
+    SNAPSHOT_METRIC = "juju_machine_state{"
+    # Self-metric in which exporter reports how long its last data collection took
+    COLLECT_DURATION_METRIC = "juju_exporter_collect_duration_seconds"
     _SNAP_ACTIONS = [
         "stop",
         "start",
@@ -42,6 +85,45 @@ class ExporterSnap:
         "exporter.port",
         "exporter.collect_interval",
     ]
+    # Options that, if present, must be positive integers
+    _POSITIVE_INT_CONFIG = [
+        "exporter.max_connections",
+        "exporter.cache_ttl",
+        "exporter.metadata_refresh_interval",
+        "exporter.query_api.max_page_size",
+        "exporter.remote_write.batch_size",
+        "exporter.remote_write.queue_size",
+        "exporter.remote_write.max_retries",
+        "juju.max_in_flight",
+        "juju.model_list_interval",
+        "exporter.tracing.max_file_size",
+        "exporter.tracing.max_files",
+        "collectors.units.interval",
+        "collectors.units.budget",
+        "collectors.applications.interval",
+        "collectors.applications.budget",
+        "collectors.relations.interval",
+        "collectors.relations.budget",
+    ]
+    # Options that, if present, must be positive (possibly fractional) numbers
+    _POSITIVE_FLOAT_CONFIG = [
+        "juju.rate_limit",
+    ]
+    # Options that, if present, must be fractions in range (0, 1]
+    _FRACTION_CONFIG = [
+        "exporter.tracing.sample_rate",
+    ]
+    # Options that, if present, must be HTTP(S) URLs
+    _URL_CONFIG = [
+        "exporter.remote_write.url",
+    ]
+    # Options that, if present, must have one of the listed values
+    _CHOICE_CONFIG = {
+        "exporter.collect_mode": ["interval", "on-demand"],
+        "replication.role": ["leader", "standby"],
+        "juju.model_discovery": ["watch", "list"],
+        "exporter.tracing.format": ["otlp-json", "chrome"],
+    }
 
     def install(self, snap_path: Optional[str] = None) -> None:
         """Install prometheus-juju-exporter snap.
@@ -65,13 +147,88 @@ class ExporterSnap:
         missing_options = []
         for option in self._REQUIRED_CONFIG:
             config_value = config
-            for identifier in option.split("."):
+            for identifier in option_path(option):
                 config_value = config_value.get(identifier, {})
             if not config_value:
                 missing_options.append(option)
 
         return missing_options
 
+    @staticmethod
+    def _get_option(config: Dict[str, Any], option: str) -> Any:
+        """Get value of a dot-separated option from config.
+
+        :raises:
+            KeyError: If the option is not present in the config.
+        """
+        value: Any = config
+        for identifier in option_path(option):
+            value = value[identifier]
+
+        return value
+
+    def _validate_positive_number(
+        self, config: Dict[str, Any], option: str, number_type: Type[Union[int, float]] = int
+    ) -> str:
+        """Validate that option, if present in config, is a positive number of expected type."""
+        try:
+            value = number_type(self._get_option(config, option))
+        except (TypeError, ValueError):
+            return f"Configuration option '{option}' must be a number.{os.linesep}"
+        except KeyError:
+            return ""  # Option was not in the config
+
+        if value <= 0:
+            return f"Configuration option '{option}' must be a positive number.{os.linesep}"
+
+        return ""
+
+    def _validate_fraction(self, config: Dict[str, Any], option: str) -> str:
+        """Validate that option, if present in config, is a number greater than 0 and up to 1."""
+        error = self._validate_positive_number(config, option, float)
+        if error:
+            return error
+
+        try:
+            value = float(self._get_option(config, option))
+        except KeyError:
+            return ""  # Option was not in the config
+
+        if value > 1:
+            return f"Configuration option '{option}' must not be greater than 1.{os.linesep}"
+
+        return ""
+
+    def _validate_url(self, config: Dict[str, Any], option: str) -> str:
+        """Validate that option, if present in config, is a HTTP(S) URL."""
+        try:
+            url = urllib.parse.urlparse(str(self._get_option(config, option)))
+        except KeyError:
+            return ""  # Option was not in the config
+        except ValueError:
+            url = urllib.parse.urlparse("")
+
+        if url.scheme not in ("http", "https") or not url.netloc:
+            return f"Configuration option '{option}' must be a valid HTTP(S) URL.{os.linesep}"
+
+        return ""
+
+    def _validate_choice(self, config: Dict[str, Any], option: str, choices: List[str]) -> str:
+        """Validate that option, if present in config, has one of the allowed values."""
+        try:
+            value = self._get_option(config, option)
+        except KeyError:
+            return ""  # Option was not in the config
+
+        if value not in choices:
+            allowed = ", ".join(choices)
+            return (
+                f"Configuration option '{option}' must be one of: {allowed}. "
+                f"Got '{value}'.{os.linesep}"
+            )
+
+        return ""
+
     @staticmethod
     def _validate_option_values(config: Dict[str, Any]) -> str:
         """Validate sane values for some of the config parameters where its feasible."""
@@ -118,22 +275,165 @@ class ExporterSnap:
             errors += f"Following config options are missing: {missing_str}{os.linesep}"
 
         errors += self._validate_option_values(config)
+        for option in self._POSITIVE_INT_CONFIG:
+            errors += self._validate_positive_number(config, option, int)
+        for option in self._POSITIVE_FLOAT_CONFIG:
+            errors += self._validate_positive_number(config, option, float)
+        for option in self._FRACTION_CONFIG:
+            errors += self._validate_fraction(config, option)
+        for option in self._URL_CONFIG:
+            errors += self._validate_url(config, option)
+        for option, choices in self._CHOICE_CONFIG.items():
+            errors += self._validate_choice(config, option, choices)
 
         if errors:
             raise ExporterConfigError(errors)
 
-    def apply_config(self, exporter_config: Dict[str, Any]) -> None:
-        """Update configuration file for exporter service."""
+    @staticmethod
+    def render_config(exporter_config: Dict[str, Any]) -> str:
+        """Render config file for exporter service.
+
+        Rendering is deterministic, the same config always produces the same content of the
+        config file.
+        """
+        return yaml.dump(
+            exporter_config, Dumper=YamlDumper, sort_keys=True, default_flow_style=False
+        )
+
+    def apply_config(
+        self, exporter_config: Dict[str, Any], rendered_config: Optional[str] = None
+    ) -> None:
+        """Update configuration file for exporter service.
+
+        :param exporter_config: config dictionary to be applied
+        :param rendered_config: :exporter_config already rendered by `render_config`, if
+            available.
+        """
         self.stop()
         logger.info("Updating exporter service configuration.")
         self.validate_config(exporter_config)
 
+        if rendered_config is None:
+            rendered_config = self.render_config(exporter_config)
         with open(self.SNAP_CONFIG_PATH, "w", encoding="utf-8") as config_file:
-            yaml.safe_dump(exporter_config, config_file)
+            config_file.write(rendered_config)
 
         self.start()
         logger.info("Exporter configuration updated.")
 
+    def _parse_collect_duration(self, metrics: str) -> Optional[float]:
+        """Find duration of the last collection in exporter's metrics, if it's reported."""
+        for line in metrics.splitlines():
+            if not line.startswith(self.COLLECT_DURATION_METRIC):
+                continue
+            name, _, value = line.rpartition(" ")
+            if name.split("{")[0] != self.COLLECT_DURATION_METRIC:
+                continue
+            try:
+                return float(value)
+            except ValueError:
+                logger.warning("Unexpected value of %s: %s", self.COLLECT_DURATION_METRIC, value)
+                return None
+
+        return None
+
+    def measure_scrape(self, port: int, timeout: float, path: str = "/metrics") -> ScrapeStats:
+        """Scrape locally running exporter and measure cost of the scrape.
+
+        :param port: Port on which the exporter service listens.
+        :param timeout: Maximum time (in seconds) to wait for the exporter's response.
+        :param path: Path of the scraped metrics endpoint.
+        :return: Time it took exporter to render metrics and duration of its last collection
+        :raises:
+            ExporterScrapeError: If exporter's metrics endpoint could not be reached.
+        """
+        start = time.monotonic()
+        metrics = self._fetch_metrics(port, timeout, path)
+        render_seconds = time.monotonic() - start
+
+        return ScrapeStats(render_seconds, self._parse_collect_duration(metrics))
+
+    @staticmethod
+    def _fetch_metrics(port: int, timeout: float, path: str = "/metrics") -> str:
+        """Fetch metrics from locally running exporter.
+
+        :raises:
+            ExporterScrapeError: If exporter's metrics endpoint could not be reached.
+        """
+        url = f"http://localhost:{port}{path}"
+        try:
+            with urllib.request.urlopen(url, timeout=timeout) as response:
+                return response.read().decode("utf-8")
+        except (OSError, ValueError) as exc:
+            raise ExporterScrapeError(f"Failed to scrape exporter at {url}: {exc}") from exc
+
+    def wait_for_snapshot(self, port: int, timeout: float, poll_interval: float = 5) -> bool:
+        """Wait until locally running exporter serves freshly collected data.
+
+        Exporter does not serve any machine data until it finishes its first data collection
+        after (re)start.
+
+        :param port: Port on which the exporter service listens.
+        :param timeout: Maximum time (in seconds) to wait for the data.
+        :param poll_interval: Time (in seconds) between attempts to fetch the data.
+        :return: True if exporter serves data, False if it did not in time.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+
+            try:
+                # Response may be delayed by data collection, it can take all the remaining time
+                if self.SNAPSHOT_METRIC in self._fetch_metrics(port, remaining):
+                    return True
+            except ExporterScrapeError as exc:
+                logger.debug("Exporter is not ready yet: %s", exc)
+
+            time.sleep(poll_interval)
+
+    def write_textfile(self, content: str) -> None:
+        """Atomically replace textfile with additional metrics for exporter to expose."""
+        tmp_path = f"{self.TEXTFILE_PATH}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as textfile:
+            textfile.write(content)
+        os.replace(tmp_path, self.TEXTFILE_PATH)
+
+    def configure_resources(self, directives: Dict[str, str]) -> bool:
+        """Limit resources available to the exporter service using systemd drop-in file.
+
+        New limits take effect when the service is restarted. If no directives are supplied,
+        the drop-in file is removed and the service runs without limits.
+
+        :param directives: systemd resource control directives (e.g. {"CPUQuota": "50%"}).
+        :return: True if the resource limits changed, otherwise False.
+        """
+        content = ""
+        if directives:
+            lines = ["[Service]"] + [f"{key}={value}" for key, value in sorted(directives.items())]
+            content = os.linesep.join(lines) + os.linesep
+
+        current_content = ""
+        if os.path.exists(self.SYSTEMD_DROPIN_PATH):
+            with open(self.SYSTEMD_DROPIN_PATH, "r", encoding="utf-8") as dropin_file:
+                current_content = dropin_file.read()
+
+        if content == current_content:
+            return False
+
+        if content:
+            logger.info("Updating resource limits of %s service.", self.SNAP_NAME)
+            os.makedirs(os.path.dirname(self.SYSTEMD_DROPIN_PATH), exist_ok=True)
+            with open(self.SYSTEMD_DROPIN_PATH, "w", encoding="utf-8") as dropin_file:
+                dropin_file.write(content)
+        else:
+            logger.info("Removing resource limits of %s service.", self.SNAP_NAME)
+            os.remove(self.SYSTEMD_DROPIN_PATH)
+
+        subprocess.call(["systemctl", "daemon-reload"])
+        return True
+
     def restart(self) -> None:
         """Restart exporter service."""
         self._execute_service_action("restart")
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# Copyright 2022 Martin Kalcok
+# See LICENSE file for licensing details.
+
+"""Hook timing helper.
+
+Module focused on measuring how long it takes charm to execute event handlers and their phases.
+"""
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List
+
+
+class HookTimer:
+    """Measure duration of a single event handler execution and its phases."""
+
+    def __init__(self, handler: str) -> None:
+        """Initialize timer for a named event handler and start measuring."""
+        self.handler = handler
+        self.started = datetime.now(timezone.utc)
+        self.phases: Dict[str, float] = {}
+        self._start = time.monotonic()
+        self.duration = 0.0
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Measure duration of a named phase of the handler.
+
+        If the same phase is executed multiple times, durations are summed up.
+        """
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.monotonic() - start
+
+    def stop(self) -> None:
+        """Stop measuring total duration of the handler."""
+        self.duration = time.monotonic() - self._start
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Get measured values in a form that can be persisted in charm's state."""
+        return {
+            "handler": self.handler,
+            "started": self.started.isoformat(),
+            "duration": round(self.duration, 6),
+            "phases": {name: round(duration, 6) for name, duration in self.phases.items()},
+        }
+
+
+def render_textfile(timings: List[Dict[str, Any]]) -> str:
+    """Render latest timings of each handler in Prometheus text format.
+
+    :param timings: Timing records, as returned by HookTimer.as_dict, ordered from the oldest.
+    """
+    latest: Dict[str, Dict[str, Any]] = {}
+    for record in timings:
+        latest[record["handler"]] = record
+
+    metric = "juju_exporter_charm_hook_duration_seconds"
+    lines = [
+        f"# HELP {metric} Duration of the latest execution of charm event handlers.",
+        f"# TYPE {metric} gauge",
+    ]
+    for handler, record in sorted(latest.items()):
+        lines.append(f'{metric}{{handler="{handler}",phase="total"}} {record["duration"]}')
+        for phase, duration in sorted(record["phases"].items()):
+            lines.append(f'{metric}{{handler="{handler}",phase="{phase}"}} {duration}')
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# Copyright 2022 Martin Kalcok
+# See LICENSE file for licensing details.
+
+"""Rolling restart helper.
+
+Module focused on coordinating exporter restarts across units of the application, so that only
+a limited number of units stops serving data at the same time.
+"""
+import json
+import logging
+from typing import List, Optional
+
+from ops.model import Application, Relation, Unit
+
+logger = logging.getLogger(__name__)
+
+
+class RollingRestart:
+    """Coordinate restarts of units in batches using data of their peer relation.
+
+    Each unit requests a restart with a token that identifies its new configuration
+    ('restart-requested'). Leader grants restarts to a batch of units ('restart-granted') and
+    units mark finished restarts with the same token ('restart-done' or 'restart-failed').
+    """
+
+    def __init__(self, relation: Relation, unit: Unit, app: Application) -> None:
+        """Initialize coordinator for the local :unit of the :app using the peer :relation."""
+        self.relation = relation
+        self.unit = unit
+        self.app = app
+
+    @property
+    def granted_units(self) -> List[str]:
+        """Get names of units that the leader allowed to restart."""
+        return json.loads(self.relation.data[self.app].get("restart-granted", "[]"))
+
+    def request(self, token: str) -> bool:
+        """Request leader's permission to restart with configuration identified by :token.
+
+        Restart is not requested if the unit already runs with this configuration. Previously
+        failed restart is requested again.
+
+        :return: True if this unit waits for its restart, False otherwise.
+        """
+        unit_data = self.relation.data[self.unit]
+        if token == unit_data.get("restart-done"):
+            logger.info("Exporter already runs with current configuration.")
+            return False
+
+        logger.info("Waiting for permission to restart exporter.")
+        unit_data.pop("restart-failed", None)
+        unit_data["restart-requested"] = token
+        return True
+
+    def update_grants(self, batch_size: int) -> None:
+        """Grant restart to the next batch of units once the current batch finished restarting.
+
+        Restart of a unit is finished when it succeeds or when the unit gives up on it, so that
+        a single failing unit does not block the rest of the application. This method has effect
+        only on the leader unit.
+        """
+        if not self.unit.is_leader():
+            return
+
+        pending = []
+        for unit in sorted([self.unit, *self.relation.units], key=lambda unit_: unit_.name):
+            unit_data = self.relation.data[unit]
+            requested = unit_data.get("restart-requested")
+            finished = (unit_data.get("restart-done"), unit_data.get("restart-failed"))
+            if requested and requested not in finished:
+                pending.append(unit.name)
+
+        granted = self.granted_units
+        in_progress = [unit for unit in granted if unit in pending]
+        if in_progress:
+            logger.debug("Waiting for units to finish restart: %s", ", ".join(in_progress))
+            return
+
+        batch = pending[:batch_size]
+        if batch != granted:
+            logger.info("Granting exporter restart to units: %s", ", ".join(batch))
+            self.relation.data[self.app]["restart-granted"] = json.dumps(batch)
+
+    def granted_restart(self) -> Optional[str]:
+        """Get token of the restart that this unit is allowed to perform now, if any."""
+        unit_data = self.relation.data[self.unit]
+        requested = unit_data.get("restart-requested")
+        if not requested or requested in (
+            unit_data.get("restart-done"),
+            unit_data.get("restart-failed"),
+        ):
+            return None
+        if self.unit.name not in self.granted_units:
+            return None
+
+        return requested
+
+    def finish(self, token: str, success: bool) -> None:
+        """Mark restart with configuration identified by :token as finished.
+
+        Both successful and failed restart release the grant of this unit.
+        """
+        self.relation.data[self.unit]["restart-done" if success else "restart-failed"] = token
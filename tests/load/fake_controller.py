@@ -0,0 +1,598 @@
+#!/usr/bin/env python3
+# Copyright 2022 Martin Kalcok
+# See LICENSE file for licensing details.
+"""Fake Juju controller for offline scale testing of prometheus-juju-exporter.
+
+This module implements a small subset of Juju API (JSON-RPC over secure websocket) that is
+sufficient for the exporter to log in, list models and collect information about machines.
+Served topology is generated deterministically from a seed, so it can scale to thousands of
+models and hundreds of thousands of machines without storing them all in memory.
+
+Run `./fake_controller.py --help` to see available options.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import ssl
+import subprocess
+import tempfile
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import websockets
+
+logger = logging.getLogger(__name__)
+
+SERVER_VERSION = "2.9.42"
+# Facades (and their versions) advertised to the clients after login.
+FACADES = {
+    "Admin": [3],
+    "AllWatcher": [1, 2],
+    "Client": [1, 2, 3, 4, 5, 6],
+    "Controller": [3, 4, 5, 6, 7, 8, 9, 10, 11],
+    "ModelManager": [2, 3, 4, 5, 6, 7, 8, 9],
+    "Pinger": [1],
+    "UserManager": [1, 2],
+}
+
+
+class FakeControllerError(Exception):
+    """Error reported back to the API client as a failed request."""
+
+    def __init__(self, message: str, code: str = "") -> None:
+        """Initialize error with message and Juju error code."""
+        super().__init__(message)
+        self.code = code
+
+
+class Topology(NamedTuple):
+    """Parameters of the generated controller topology.
+
+    :param models: Number of models on the controller.
+    :param machines: Total number of machines (including containers) across all models.
+    :param container_ratio: Fraction of machines that are LXD containers.
+    :param vm_ratio: Fraction of non-container machines that are virtual machines.
+    :param down_ratio: Fraction of machines with agent in 'down' state.
+    :param seed: Seed that makes generated topology reproducible.
+    """
+
+    models: int = 10
+    machines: int = 100
+    container_ratio: float = 0.3
+    vm_ratio: float = 0.5
+    down_ratio: float = 0.01
+    seed: int = 0
+
+
+class FaultInjection(NamedTuple):
+    """Artificial latency and errors applied to API requests.
+
+    :param latency: Base latency (in seconds) added to every request.
+    :param jitter: Maximum random latency (in seconds) added on top of the base latency.
+    :param error_rate: Fraction of requests (0.0 - 1.0) that fail with an error.
+    """
+
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+
+
+class FakeModel:
+    """Model with deterministically generated machines."""
+
+    def __init__(self, index: int, machine_count: int, topology: Topology) -> None:
+        """Initialize model metadata. Machines are generated only when requested."""
+        self.index = index
+        self.machine_count = machine_count
+        self.topology = topology
+        self.name = "controller" if index == 0 else f"model-{index}"
+        self.uuid = str(uuid.UUID(int=random.Random(f"{topology.seed}-{index}").getrandbits(128)))
+
+    def _machine_status(self, machine_id: str, rng: random.Random, kind: str) -> Dict[str, Any]:
+        """Generate status of a single machine in the format of Juju's FullStatus."""
+        status = "down" if rng.random() < self.topology.down_ratio else "started"
+        virt_type = {"lxd": "container", "kvm": "virtual-machine"}.get(kind)
+        hardware = "arch=amd64 cores=4 mem=8192M"
+        if virt_type:
+            hardware += f" virt-type={virt_type}"
+        hostname = f"juju-{self.uuid[-6:]}-{self.index}-{machine_id.replace('/', '-')}"
+        ip_address = f"10.{self.index % 256}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+        since = "2022-11-30T12:00:00Z"
+
+        return {
+            "id": machine_id,
+            "hostname": hostname,
+            "display-name": "",
+            "instance-id": hostname if kind == "lxd" else f"{kind}-{machine_id}",
+            "agent-status": {"status": status, "info": "", "since": since, "version": ""},
+            "instance-status": {"status": "running", "info": "", "since": since},
+            "modification-status": {"status": "idle", "info": "", "since": since},
+            "dns-name": ip_address,
+            "ip-addresses": [ip_address],
+            "series": "jammy",
+            "base": {"name": "ubuntu", "channel": "22.04"},
+            "hardware": hardware,
+            "jobs": ["JobHostUnits"],
+            "has-vote": False,
+            "wants-vote": False,
+            "containers": {},
+            "network-interfaces": {},
+            "constraints": "",
+            "lxd-profiles": {},
+        }
+
+    def machines(self) -> Dict[str, Dict[str, Any]]:
+        """Generate machines of this model, containers are nested in their hosts."""
+        rng = random.Random(f"{self.topology.seed}-{self.index}-machines")
+        containers = int(self.machine_count * self.topology.container_ratio)
+        hosts = max(self.machine_count - containers, 1 if self.machine_count else 0)
+        containers = self.machine_count - hosts
+
+        machines = {}
+        for host_id in range(hosts):
+            kind = "kvm" if rng.random() < self.topology.vm_ratio else "metal"
+            machines[str(host_id)] = self._machine_status(str(host_id), rng, kind)
+
+        for container_index in range(containers):
+            host_id = str(container_index % hosts)
+            container_id = f"{host_id}/lxd/{container_index // hosts}"
+            container = self._machine_status(container_id, rng, "lxd")
+            machines[host_id]["containers"][container_id] = container
+
+        return machines
+
+    def summary(self, controller_uuid: str) -> Dict[str, Any]:
+        """Generate model summary as returned by ModelManager.ListModelSummaries."""
+        return {
+            "name": self.name,
+            "uuid": self.uuid,
+            "type": "iaas",
+            "controller-uuid": controller_uuid,
+            "is-controller": self.index == 0,
+            "provider-type": "maas",
+            "default-series": "jammy",
+            "cloud-tag": "cloud-fake",
+            "cloud-region": "default",
+            "cloud-credential-tag": "cloudcred-fake_admin_default",
+            "owner-tag": "user-admin",
+            "life": "alive",
+            "status": {"status": "available", "info": "", "since": "2022-11-30T12:00:00Z"},
+            "user-access": "admin",
+            "last-connection": None,
+            "counts": [{"entity": "machines", "count": self.machine_count}],
+            "agent-version": SERVER_VERSION,
+        }
+
+    def full_status(self) -> Dict[str, Any]:
+        """Generate model status as returned by Client.FullStatus."""
+        return {
+            "model": {
+                "name": self.name,
+                "type": "iaas",
+                "cloud-tag": "cloud-fake",
+                "region": "default",
+                "version": SERVER_VERSION,
+                "available-version": "",
+                "model-status": {"status": "available", "info": ""},
+                "sla": "unsupported",
+            },
+            "machines": self.machines(),
+            "applications": {},
+            "remote-applications": {},
+            "offers": {},
+            "relations": [],
+            "controller-timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "branches": {},
+        }
+
+    def deltas(self) -> List[List[Any]]:
+        """Generate machine deltas as returned by the first AllWatcher.Next call."""
+        deltas = []
+        pending = list(self.machines().values())
+        while pending:
+            machine = pending.pop()
+            pending.extend(machine["containers"].values())
+            agent_status = machine["agent-status"]
+            deltas.append(
+                [
+                    "machine",
+                    "change",
+                    {
+                        "model-uuid": self.uuid,
+                        "id": machine["id"],
+                        "instance-id": machine["instance-id"],
+                        "hostname": machine["hostname"],
+                        "life": "alive",
+                        "series": machine["series"],
+                        "agent-status": {
+                            "current": agent_status["status"],
+                            "message": "",
+                            "since": agent_status["since"],
+                            "version": "",
+                        },
+                        "instance-status": {"current": "running", "message": "", "version": ""},
+                        "hardware-characteristics": dict(
+                            item.split("=") for item in machine["hardware"].split()
+                        ),
+                        "addresses": [
+                            {"value": ip, "type": "ipv4", "scope": "local-cloud"}
+                            for ip in machine["ip-addresses"]
+                        ],
+                        "jobs": machine["jobs"],
+                        "has-vote": False,
+                        "wants-vote": False,
+                    },
+                ]
+            )
+
+        return deltas
+
+
+class FakeController:
+    """Websocket server that speaks subset of Juju API used by the exporter."""
+
+    USERNAME = "admin"
+    PASSWORD = "password"
+
+    def __init__(
+        self,
+        topology: Topology,
+        faults: FaultInjection = FaultInjection(),
+        host: str = "127.0.0.1",
+        port: int = 17070,
+    ) -> None:
+        """Initialize fake controller with generated topology."""
+        self.topology = topology
+        self.faults = faults
+        self.host = host
+        self.port = port
+        self.uuid = str(uuid.UUID(int=random.Random(topology.seed).getrandbits(128)))
+        self.ca_cert = ""
+        self.request_counts: Counter = Counter()
+        self.error_count = 0
+        self.active_connections = 0
+        self.peak_connections = 0
+        self._rng = random.Random(topology.seed)
+        self._server: Any = None
+        self._tmp_dir = tempfile.TemporaryDirectory()  # pylint: disable=R1732
+
+        per_model, remainder = divmod(topology.machines, topology.models)
+        self.models = {}
+        for index in range(topology.models):
+            model = FakeModel(index, per_model + (1 if index < remainder else 0), topology)
+            self.models[model.uuid] = model
+
+    @property
+    def endpoint(self) -> str:
+        """Get controller endpoint in the <IP>:<PORT> format."""
+        return f"{self.host}:{self.port}"
+
+    def _create_ssl_context(self) -> ssl.SSLContext:
+        """Generate self-signed certificate and create server SSL context from it."""
+        cert_path = Path(self._tmp_dir.name, "cert.pem")
+        key_path = Path(self._tmp_dir.name, "key.pem")
+        subprocess.run(
+            [
+                "openssl",
+                "req",
+                "-x509",
+                "-newkey",
+                "rsa:2048",
+                "-nodes",
+                "-days",
+                "1",
+                "-subj",
+                "/CN=juju-apiserver",
+                "-addext",
+                f"subjectAltName=IP:{self.host},DNS:juju-apiserver,DNS:localhost",
+                "-keyout",
+                str(key_path),
+                "-out",
+                str(cert_path),
+            ],
+            check=True,
+            capture_output=True,
+        )
+        self.ca_cert = cert_path.read_text(encoding="ascii")
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert_path, key_path)
+
+        return context
+
+    async def start(self) -> None:
+        """Start listening for API connections."""
+        self._server = await websockets.serve(
+            self._handle_connection,
+            self.host,
+            self.port,
+            ssl=self._create_ssl_context(),
+            max_size=None,
+        )
+        logger.info(
+            "Fake controller with %d models and %d machines listens on %s",
+            self.topology.models,
+            self.topology.machines,
+            self.endpoint,
+        )
+
+    async def stop(self) -> None:
+        """Stop the server and clean up generated certificates."""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        self._tmp_dir.cleanup()
+
+    @staticmethod
+    def _request_path(websocket: Any) -> str:
+        """Get requested path, regardless of the 'websockets' library version."""
+        request = getattr(websocket, "request", None)
+        if request is not None:
+            return str(request.path)
+        return str(websocket.path)
+
+    def _resolve_model(self, path: str) -> Optional[FakeModel]:
+        """Find model that the client connected to based on the request path.
+
+        :raises:
+            FakeControllerError: If the path refers to a model that does not exist.
+        """
+        parts = path.strip("/").split("/")
+        if parts == ["api"]:
+            return None
+        if len(parts) == 3 and parts[0] == "model" and parts[1] in self.models:
+            return self.models[parts[1]]
+
+        raise FakeControllerError(f"unknown model in path {path}", "not found")
+
+    async def _handle_connection(self, websocket: Any, *_: Any) -> None:
+        """Serve API requests received over a single websocket connection."""
+        self.active_connections += 1
+        self.peak_connections = max(self.peak_connections, self.active_connections)
+        session: Dict[str, Any] = {
+            "path": self._request_path(websocket),
+            "watchers": {},
+            "tasks": set(),
+        }
+        try:
+            async for message in websocket:
+                request = json.loads(message)
+                # Keep reference to the pending response, so it's not garbage-collected
+                task = asyncio.ensure_future(self._respond(websocket, session, request))
+                session["tasks"].add(task)
+                task.add_done_callback(session["tasks"].discard)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self.active_connections -= 1
+
+    async def _respond(
+        self, websocket: Any, session: Dict[str, Any], request: Dict[str, Any]
+    ) -> None:
+        """Process single request and send response to the client."""
+        method = f"{request.get('type')}.{request.get('request')}"
+        self.request_counts[method] += 1
+        reply: Dict[str, Any] = {"request-id": request.get("request-id")}
+
+        delay = self.faults.latency + self._rng.uniform(0, self.faults.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+
+        try:
+            if self.faults.error_rate and self._rng.random() < self.faults.error_rate:
+                raise FakeControllerError("injected failure")
+            reply["response"] = await self._dispatch(method, session, request)
+        except FakeControllerError as exc:
+            self.error_count += 1
+            reply.update({"error": str(exc), "error-code": exc.code, "response": {}})
+
+        try:
+            await websocket.send(json.dumps(reply))
+        except websockets.ConnectionClosed:
+            pass
+
+    async def _dispatch(
+        self, method: str, session: Dict[str, Any], request: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Call handler of the requested API method."""
+        # Watcher methods address the watcher by ID of the request
+        watcher_id = str(request.get("id"))
+        handlers = {
+            "Admin.Login": self._login,
+            "Pinger.Ping": lambda *_: {},
+            "ModelManager.ListModels": self._list_models,
+            "ModelManager.ListModelSummaries": self._list_model_summaries,
+            "Client.FullStatus": self._full_status,
+            "Client.WatchAll": self._watch_all,
+            "AllWatcher.Next": lambda session, _: self._watcher_next(session, watcher_id),
+            "AllWatcher.Stop": lambda session, _: self._watcher_stop(session, watcher_id),
+        }
+        handler = handlers.get(method)
+        if handler is None:
+            raise FakeControllerError(f"{method} is not implemented", "not implemented")
+
+        if method != "Admin.Login" and not session.get("logged_in"):
+            raise FakeControllerError("not logged in", "unauthorized access")
+
+        result = handler(session, request.get("params", {}))
+        if asyncio.iscoroutine(result):
+            result = await result
+
+        return result
+
+    def _login(self, session: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+        """Authenticate client with static credentials."""
+        if (params.get("auth-tag"), params.get("credentials")) != (
+            f"user-{self.USERNAME}",
+            self.PASSWORD,
+        ):
+            raise FakeControllerError("invalid entity name or password", "unauthorized access")
+
+        model = self._resolve_model(session["path"])
+        session["model"] = model
+        session["logged_in"] = True
+
+        return {
+            "servers": [[{"value": self.host, "port": self.port, "type": "ipv4", "scope": ""}]],
+            "controller-tag": f"controller-{self.uuid}",
+            "model-tag": f"model-{model.uuid}" if model else "",
+            "user-info": {
+                "display-name": self.USERNAME,
+                "identity": f"user-{self.USERNAME}",
+                "controller-access": "superuser",
+                "model-access": "admin" if model else "",
+            },
+            "facades": [
+                {"name": name, "versions": versions} for name, versions in FACADES.items()
+            ],
+            "server-version": SERVER_VERSION,
+            "public-dns-name": "",
+        }
+
+    def _list_models(self, *_: Any) -> Dict[str, Any]:
+        """List all models on the controller."""
+        return {
+            "user-models": [
+                {
+                    "model": {
+                        "name": model.name,
+                        "uuid": model.uuid,
+                        "type": "iaas",
+                        "owner-tag": "user-admin",
+                    },
+                    "last-connection": None,
+                }
+                for model in self.models.values()
+            ]
+        }
+
+    def _list_model_summaries(self, *_: Any) -> Dict[str, Any]:
+        """List summaries of all models on the controller."""
+        return {
+            "results": [{"result": model.summary(self.uuid)} for model in self.models.values()]
+        }
+
+    @staticmethod
+    def _current_model(session: Dict[str, Any]) -> FakeModel:
+        """Get model of the current connection.
+
+        :raises:
+            FakeControllerError: If client is connected to the controller and not to a model.
+        """
+        model = session.get("model")
+        if model is None:
+            raise FakeControllerError("facade not supported on controller connection")
+        return model
+
+    def _full_status(self, session: Dict[str, Any], _: Dict[str, Any]) -> Dict[str, Any]:
+        """Get status of the current model."""
+        return self._current_model(session).full_status()
+
+    def _watch_all(self, session: Dict[str, Any], _: Dict[str, Any]) -> Dict[str, Any]:
+        """Create AllWatcher for the current model."""
+        model = self._current_model(session)
+        session["watcher_count"] = session.get("watcher_count", 0) + 1
+        watcher_id = str(session["watcher_count"])
+        session["watchers"][watcher_id] = {
+            "model": model,
+            "initial": True,
+            "stopped": asyncio.Event(),
+        }
+        return {"watcher-id": watcher_id}
+
+    @staticmethod
+    def _get_watcher(session: Dict[str, Any], watcher_id: str) -> Dict[str, Any]:
+        """Find watcher of the current connection by its ID."""
+        watcher = session["watchers"].get(watcher_id)
+        if watcher is None:
+            raise FakeControllerError(f"watcher {watcher_id} not found", "not found")
+
+        return watcher
+
+    async def _watcher_next(self, session: Dict[str, Any], watcher_id: str) -> Dict[str, Any]:
+        """Return all machines on the first call, block on the subsequent calls."""
+        watcher = self._get_watcher(session, watcher_id)
+        if watcher["initial"]:
+            watcher["initial"] = False
+            return {"deltas": watcher["model"].deltas()}
+
+        # Topology is static, nothing will change until the watcher is stopped
+        await watcher["stopped"].wait()
+        raise FakeControllerError("watcher was stopped", "stopped")
+
+    def _watcher_stop(self, session: Dict[str, Any], watcher_id: str) -> Dict[str, Any]:
+        """Stop watcher of the current connection."""
+        watcher = self._get_watcher(session, watcher_id)
+        watcher["stopped"].set()
+        del session["watchers"][watcher_id]
+        return {}
+
+
+def add_controller_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add CLI arguments that configure fake controller."""
+    group = parser.add_argument_group("fake controller")
+    group.add_argument("--host", default="127.0.0.1", help="Address to listen on.")
+    group.add_argument("--port", type=int, default=17070, help="Port to listen on.")
+    group.add_argument("--models", type=int, default=10, help="Number of models.")
+    group.add_argument("--machines", type=int, default=100, help="Total number of machines.")
+    group.add_argument("--container-ratio", type=float, default=0.3)
+    group.add_argument("--vm-ratio", type=float, default=0.5)
+    group.add_argument("--down-ratio", type=float, default=0.01)
+    group.add_argument("--seed", type=int, default=0, help="Seed of the generated topology.")
+    group.add_argument("--latency-ms", type=float, default=0.0, help="Latency of each request.")
+    group.add_argument("--jitter-ms", type=float, default=0.0, help="Random extra latency.")
+    group.add_argument(
+        "--error-rate", type=float, default=0.0, help="Fraction of requests that fail."
+    )
+
+
+def controller_from_args(args: argparse.Namespace) -> FakeController:
+    """Create fake controller configured by CLI arguments."""
+    topology = Topology(
+        models=args.models,
+        machines=args.machines,
+        container_ratio=args.container_ratio,
+        vm_ratio=args.vm_ratio,
+        down_ratio=args.down_ratio,
+        seed=args.seed,
+    )
+    faults = FaultInjection(
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        error_rate=args.error_rate,
+    )
+    return FakeController(topology, faults, args.host, args.port)
+
+
+async def _serve_forever(controller: FakeController) -> None:
+    """Run controller until interrupted."""
+    await controller.start()
+    print(f"Endpoint: {controller.endpoint}")
+    print(f"Username: {controller.USERNAME}")
+    print(f"Password: {controller.PASSWORD}")
+    print(f"CA certificate:{chr(10)}{controller.ca_cert}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await controller.stop()
+
+
+def main() -> None:
+    """Run standalone fake controller."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_controller_arguments(parser)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(_serve_forever(controller_from_args(args)))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
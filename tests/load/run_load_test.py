@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# Copyright 2022 Martin Kalcok
+# See LICENSE file for licensing details.
+r"""Load test of prometheus-juju-exporter against a fake Juju controller.
+
+This script starts fake Juju controller with generated topology, runs the exporter configured
+to collect data from it and measures:
+  * how long it takes the exporter to complete the first data collection
+  * how many API requests were needed for it
+  * latency and throughput of concurrent '/metrics' scrapes
+  * peak memory usage of the exporter process
+
+With '--cpu-quota', the exporter runs in a transient systemd scope with the same CPUQuota
+limit that the charm applies via 'cpu-quota' option. Running the test with increasing quotas
+shows how collection throughput scales with CPU available to the exporter.
+
+Exporter is started with the command supplied by '--exporter-cmd'. Path to the generated
+exporter config file is available in the command as '{config}' placeholder and the directory
+that contains it is exported as SNAP_DATA environment variable, e.g.:
+
+    ./run_load_test.py --models 1000 --machines 100000 \
+        --exporter-cmd "python3 -m prometheus_juju_exporter"
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shlex
+import statistics
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import yaml
+from fake_controller import (
+    FakeController,
+    add_controller_arguments,
+    controller_from_args,
+)
+
+logger = logging.getLogger(__name__)
+
+MACHINE_METRIC = "juju_machine_state{"
+
+
+def generate_exporter_config(controller: FakeController, port: int) -> Dict[str, Any]:
+    """Generate exporter config that targets fake controller."""
+    return {
+        "customer": {"name": "Load Test", "cloud_name": "Fake Cloud"},
+        "exporter": {"port": port, "collect_interval": 1},
+        "juju": {
+            "controller_endpoint": controller.endpoint,
+            "controller_cacert": controller.ca_cert,
+            "username": controller.USERNAME,
+            "password": controller.PASSWORD,
+        },
+    }
+
+
+def scrape(url: str, timeout: float) -> str:
+    """Fetch exporter metrics."""
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return response.read().decode("utf-8")
+
+
+def count_machines(metrics: str) -> int:
+    """Count machines reported in the exporter metrics."""
+    return sum(1 for line in metrics.splitlines() if line.startswith(MACHINE_METRIC))
+
+
+def peak_memory_kib(pid: int) -> Optional[int]:
+    """Get peak resident memory size of a process (in KiB), if available."""
+    try:
+        with open(f"/proc/{pid}/status", "r", encoding="utf-8") as status_file:
+            for line in status_file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+
+    return None
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Get percentile of measured values."""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def wait_for_collection(url: str, expected: int, timeout: float) -> float:
+    """Wait until exporter reports all machines and return how long it took.
+
+    :raises:
+        TimeoutError: If exporter does not report all machines in time.
+    """
+    loop = asyncio.get_event_loop()
+    start = time.monotonic()
+    while time.monotonic() - start < timeout:
+        try:
+            metrics = await loop.run_in_executor(None, scrape, url, timeout)
+            machines = count_machines(metrics)
+            if machines >= expected:
+                return time.monotonic() - start
+            logger.debug("Exporter reports %d out of %d machines.", machines, expected)
+        except OSError:
+            logger.debug("Exporter is not ready yet.")
+        await asyncio.sleep(0.5)
+
+    raise TimeoutError(f"Exporter did not report {expected} machines within {timeout}s.")
+
+
+async def measure_scrapes(
+    url: str, count: int, concurrency: int, timeout: float
+) -> Dict[str, float]:
+    """Run concurrent scrapes and measure their latency and throughput."""
+    loop = asyncio.get_event_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def _timed_scrape() -> None:
+        nonlocal errors
+        async with semaphore:
+            start = time.monotonic()
+            try:
+                await loop.run_in_executor(None, scrape, url, timeout)
+                latencies.append(time.monotonic() - start)
+            except OSError:
+                errors += 1
+
+    start = time.monotonic()
+    await asyncio.gather(*(_timed_scrape() for _ in range(count)))
+    duration = time.monotonic() - start
+    if not latencies:
+        raise RuntimeError("All scrapes failed.")
+
+    return {
+        "scrapes": count,
+        "concurrency": concurrency,
+        "errors": errors,
+        "throughput_per_second": len(latencies) / duration,
+        "latency_p50_seconds": statistics.median(latencies),
+        "latency_p95_seconds": percentile(latencies, 0.95),
+        "latency_p99_seconds": percentile(latencies, 0.99),
+        "latency_max_seconds": max(latencies),
+    }
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    """Run the load test and return the report."""
+    controller = controller_from_args(args)
+    await controller.start()
+    url = f"http://127.0.0.1:{args.exporter_port}/metrics"
+    report: Dict[str, Any] = {"models": args.models, "machines": args.machines}
+
+    with tempfile.TemporaryDirectory() as snap_data:
+        config_path = Path(snap_data, "config.yaml")
+        config = generate_exporter_config(controller, args.exporter_port)
+        config_path.write_text(yaml.safe_dump(config), encoding="utf-8")
+        command = shlex.split(args.exporter_cmd.format(config=config_path))
+        if args.cpu_quota:
+            report["cpu_quota"] = args.cpu_quota
+            scope = ["systemd-run", "--user", "--scope", "--quiet"]
+            command = scope + ["-p", f"CPUQuota={args.cpu_quota}%"] + command
+        process = await asyncio.create_subprocess_exec(
+            *command, env={**os.environ, "SNAP_DATA": snap_data}
+        )
+        try:
+            collection_seconds = await wait_for_collection(
+                url, args.machines, args.collection_timeout
+            )
+            requests = sum(controller.request_counts.values())
+            report["collection"] = {
+                "duration_seconds": collection_seconds,
+                "machines_per_second": args.machines / collection_seconds,
+                "api_requests": requests,
+                "api_requests_per_second": requests / collection_seconds,
+                "api_errors": controller.error_count,
+                "peak_api_connections": controller.peak_connections,
+                "api_requests_by_method": dict(controller.request_counts),
+            }
+            report["scrape"] = await measure_scrapes(
+                url, args.scrapes, args.concurrency, args.scrape_timeout
+            )
+            report["exporter_peak_memory_kib"] = peak_memory_kib(process.pid)
+        finally:
+            process.terminate()
+            await process.wait()
+            await controller.stop()
+
+    return report
+
+
+def main() -> None:
+    """Parse arguments, run the load test and print the report."""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    add_controller_arguments(parser)
+    group = parser.add_argument_group("exporter")
+    group.add_argument("--exporter-cmd", required=True, help="Command that starts the exporter.")
+    group.add_argument("--exporter-port", type=int, default=15000)
+    group.add_argument("--collection-timeout", type=float, default=600.0)
+    group.add_argument("--scrapes", type=int, default=100, help="Number of measured scrapes.")
+    group.add_argument("--concurrency", type=int, default=4, help="Number of parallel scrapers.")
+    group.add_argument("--scrape-timeout", type=float, default=60.0)
+    group.add_argument(
+        "--cpu-quota", type=int, default=0, help="Limit exporter CPU usage (in % of one CPU)."
+    )
+    parser.add_argument("--debug", action="store_true", help="Enable debug logging.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,7 @@ import pytest
 import yaml
 
 import charm
+from exporter import ScrapeStats
 
 
 @pytest.mark.parametrize(
@@ -19,7 +20,13 @@ import charm
     [
         ("on.config_changed", "_on_config_changed"),
         ("on.install", "_on_install"),
+        ("on.update_status", "_on_update_status"),
+        ("on.leader_elected", "_on_leader_elected"),
         ("prometheus_target.on.prometheus_available", "_on_prometheus_available"),
+        (
+            "prometheus_summary_target.on.prometheus_available",
+            "_on_prometheus_summary_available",
+        ),
     ],
 )
 def test_charm_event_mapping(event_name, handler, harness, mocker):
@@ -72,6 +79,7 @@ def test_get_controller_ca_from_file(agent_conf_data, expect_fail, harness, mock
     agent_config_path = pathlib.Path(charm_path).joinpath("../agent.conf")
     agent_conf_content = yaml.safe_dump(agent_conf_data, indent=2)
     mocker.patch.object(charm.hookenv, "charm_dir", return_value=charm_path)
+    mocker.patch.object(charm.os, "stat", return_value=mock.Mock(st_ino=1, st_mtime_ns=1))
 
     with mock.patch("builtins.open", mock.mock_open(read_data=agent_conf_content)) as open_mock:
         if expect_fail:
@@ -85,6 +93,28 @@ def test_get_controller_ca_from_file(agent_conf_data, expect_fail, harness, mock
     open_mock.assert_called_once_with(agent_config_path, "r", encoding="utf-8")
 
 
+def test_load_agent_conf_cached(harness, mocker):
+    """Test that agent.conf is parsed again only if its inode or modification time changed."""
+    agent_conf_content = yaml.safe_dump({"cacert": "CA", "apiaddresses": ["10.0.0.1:17070"]})
+    mocker.patch.object(charm.hookenv, "charm_dir", return_value="/var/lib/juju/agents/unit-0/")
+    mock_stat = mocker.patch.object(charm.os, "stat")
+    stats = [
+        mock.Mock(st_ino=1, st_mtime_ns=100),
+        mock.Mock(st_ino=1, st_mtime_ns=100),
+        mock.Mock(st_ino=2, st_mtime_ns=100),
+        mock.Mock(st_ino=2, st_mtime_ns=200),
+    ]
+    expected_parsed = [True, False, True, True]
+
+    for stat, parsed in zip(stats, expected_parsed):
+        mock_stat.return_value = stat
+        with mock.patch("builtins.open", mock.mock_open(read_data=agent_conf_content)) as file_:
+            agent_conf = harness.charm.load_agent_conf()
+
+        assert agent_conf == {"cacert": "CA", "apiaddresses": ["10.0.0.1:17070"]}
+        assert file_.called == parsed
+
+
 @pytest.mark.parametrize(
     "ca_data, expect_fail",
     [
@@ -105,6 +135,64 @@ def test_get_controller_ca_from_config(ca_data, expect_fail, harness):
         assert expected_data == harness.charm.get_controller_ca()
 
 
+@pytest.mark.parametrize(
+    "endpoints, expected_endpoints",
+    [
+        (
+            ["10.0.0.5:17070", "10.0.0.1:17070", "127.0.0.1:17070"],
+            ["127.0.0.1:17070", "10.0.0.1:17070", "10.0.0.5:17070"],
+        ),
+        (
+            ["controller:17070", "[::1]:17070", "localhost:17070"],
+            ["[::1]:17070", "localhost:17070", "controller:17070"],
+        ),
+        (["10.0.0.6:17070", "10.0.0.5:17070"], ["10.0.0.6:17070", "10.0.0.5:17070"]),
+    ],
+)
+def test_rank_controller_endpoints(endpoints, expected_endpoints):
+    """Test that loopback and local endpoints are preferred."""
+    local_addresses = ["10.0.0.1", "192.168.0.1"]
+
+    ranked = charm.rank_controller_endpoints(endpoints, local_addresses)
+
+    assert ranked == expected_endpoints
+
+
+@pytest.mark.parametrize(
+    "agent_conf_data, expect_fail",
+    [
+        ({"apiaddresses": ["10.0.0.5:17070", "10.0.0.1:17070"]}, False),
+        ({}, True),
+    ],
+)
+def test_get_controller_endpoints(agent_conf_data, expect_fail, harness, mocker):
+    """Test discovering controller endpoints from agent.conf."""
+    mocker.patch.object(harness.charm, "load_agent_conf", return_value=agent_conf_data)
+    mocker.patch.object(charm.hookenv, "unit_private_ip", return_value="10.0.0.1")
+    mocker.patch.object(charm.hookenv, "unit_public_ip", return_value="192.168.0.1")
+
+    if expect_fail:
+        with pytest.raises(RuntimeError):
+            harness.charm._get_controller_endpoints()
+    else:
+        expected_endpoints = ["10.0.0.1:17070", "10.0.0.5:17070"]
+        assert harness.charm._get_controller_endpoints() == expected_endpoints
+
+
+def test_generate_exporter_config_auto_endpoint(harness, mocker):
+    """Test that discovered controller endpoints are used if 'controller-url' is 'auto'."""
+    endpoints = ["127.0.0.1:17070", "10.0.0.5:17070"]
+    mocker.patch.object(harness.charm, "get_controller_ca", return_value="ca")
+    mocker.patch.object(harness.charm, "_get_controller_endpoints", return_value=endpoints)
+    with harness.hooks_disabled():
+        harness.update_config({"controller-url": "auto"})
+
+    juju_config = harness.charm.generate_exporter_config()["juju"]
+
+    assert juju_config["controller_endpoint"] == endpoints[0]
+    assert juju_config["controller_endpoints"] == endpoints
+
+
 def test_generate_exporter_config_complete(harness, mocker):
     """Test generating complete config file for exporter snap."""
     port = 5000
@@ -115,6 +203,8 @@ def test_generate_exporter_config_complete(harness, mocker):
     user = "foo"
     password = "bar"
     interval = 5
+    max_connections = 8
+    rate_limit = 2.5
     mocker.patch.object(harness.charm, "get_controller_ca", return_value=ca_cert)
 
     expected_snap_config = {
@@ -125,12 +215,26 @@ def test_generate_exporter_config_complete(harness, mocker):
         "exporter": {
             "collect_interval": interval,
             "port": port,
+            "max_connections": max_connections,
+            "collect_mode": "interval",
+            "cache_ttl": 300,
+            "metadata_refresh_interval": 360,
+            "state_transitions": True,
+            "query_api": {"enabled": False, "max_page_size": 500},
         },
         "juju": {
             "controller_endpoint": controller,
             "password": password,
             "username": user,
             "controller_cacert": ca_cert,
+            "rate_limit": rate_limit,
+            "adaptive_backoff": False,
+            "model_discovery": "watch",
+            "model_list_interval": 10,
+            "skip_unavailable_models": True,
+        },
+        "collectors": {
+            "units": {"enabled": True, "interval": 5, "budget": 30},
         },
     }
 
@@ -144,6 +248,12 @@ def test_generate_exporter_config_complete(harness, mocker):
                 "juju-password": password,
                 "scrape-interval": interval,
                 "scrape-port": port,
+                "scrape-max-connections": max_connections,
+                "api-rate-limit": rate_limit,
+                "api-adaptive-backoff": False,
+                "units-collector": True,
+                "units-collector-interval": 5,
+                "units-collector-budget": 30,
             }
         )
 
@@ -152,6 +262,112 @@ def test_generate_exporter_config_complete(harness, mocker):
     assert snap_config == expected_snap_config
 
 
+def test_generate_exporter_config_remote_write(harness, mocker):
+    """Test that remote-write section is rendered only if remote-write URL is set."""
+    url = "http://prometheus:9090/api/v1/write"
+    mocker.patch.object(harness.charm, "get_controller_ca", return_value="ca")
+
+    assert "remote_write" not in harness.charm.generate_exporter_config()["exporter"]
+
+    with harness.hooks_disabled():
+        harness.update_config({"remote-write-url": url, "remote-write-batch-size": 100})
+
+    remote_write = harness.charm.generate_exporter_config()["exporter"]["remote_write"]
+
+    assert remote_write["url"] == url
+    assert remote_write["batch_size"] == 100
+
+
+def test_generate_exporter_config_collectors(harness, mocker):
+    """Test that collectors section is rendered only for enabled collectors."""
+    mocker.patch.object(harness.charm, "get_controller_ca", return_value="ca")
+
+    assert "collectors" not in harness.charm.generate_exporter_config()
+
+    with harness.hooks_disabled():
+        harness.update_config({"relations-collector": True})
+
+    collectors = harness.charm.generate_exporter_config()["collectors"]
+
+    assert collectors == {"relations": {"enabled": True, "interval": 15, "budget": 60}}
+
+
+def test_generate_exporter_config_tracing(harness, mocker):
+    """Test that tracing section, including trace directory, is rendered only if enabled."""
+    mocker.patch.object(harness.charm, "get_controller_ca", return_value="ca")
+
+    assert "tracing" not in harness.charm.generate_exporter_config()["exporter"]
+
+    with harness.hooks_disabled():
+        harness.update_config({"trace-sample-rate": 0.25, "trace-format": "chrome"})
+
+    tracing = harness.charm.generate_exporter_config()["exporter"]["tracing"]
+    assert tracing["sample_rate"] == 0.25
+    assert tracing["format"] == "chrome"
+    assert tracing["path"] == harness.charm.exporter.TRACES_PATH
+
+
+def test_generate_resource_limits(harness):
+    """Test that resource limits are rendered as systemd directives."""
+    with harness.hooks_disabled():
+        harness.update_config(
+            {
+                "cpu-quota": 150,
+                "nice-level": 10,
+                "io-scheduling-class": "idle",
+                "memory-max": "512M",
+            }
+        )
+
+    assert harness.charm.generate_resource_limits() == {
+        "CPUQuota": "150%",
+        "Nice": "10",
+        "IOSchedulingClass": "idle",
+        "MemoryMax": "512M",
+    }
+
+
+def test_generate_resource_limits_default(harness):
+    """Test that resources are not limited by default."""
+    assert harness.charm.generate_resource_limits() == {}
+
+
+@pytest.mark.parametrize(
+    "option, value",
+    [
+        ("cpu-quota", -1),
+        ("nice-level", -21),
+        ("nice-level", 20),
+        ("io-scheduling-class", "fast"),
+        ("memory-max", "512MB"),
+        ("memory-max", "lots"),
+    ],
+)
+def test_generate_resource_limits_invalid(option, value, harness):
+    """Test that invalid resource limits raise error that mentions the charm option."""
+    with harness.hooks_disabled():
+        harness.update_config({option: value})
+
+    with pytest.raises(charm.ExporterConfigError) as exc:
+        harness.charm.generate_resource_limits()
+
+    assert option in str(exc.value)
+
+
+def test_generate_resource_limits_multiple_errors(harness):
+    """Test that each invalid resource limit is reported on a separate line."""
+    with harness.hooks_disabled():
+        harness.update_config({"io-scheduling-class": "fast", "memory-max": "lots"})
+
+    with pytest.raises(charm.ExporterConfigError) as exc:
+        harness.charm.generate_resource_limits()
+
+    errors = str(exc.value).splitlines()
+    assert len(errors) == 2
+    assert "io-scheduling-class" in errors[0]
+    assert "memory-max" in errors[1]
+
+
 def test_generate_exporter_config_incomplete(harness, mocker):
     """Test that generated config won't contain keys for missing config options."""
     expected_missing_config = {"juju": ["controller", "user", "password"]}
@@ -180,6 +396,275 @@ def test_generate_exporter_config_incomplete(harness, mocker):
             assert key in snap_config[section]
 
 
+@pytest.mark.parametrize(
+    "leader, leader_address, expected_config",
+    [
+        (True, None, {"role": "leader"}),
+        (False, None, {"role": "standby"}),
+        (False, "10.0.0.2", {"role": "standby", "upstream": "http://10.0.0.2:5000"}),
+    ],
+)
+def test_generate_replication_config(leader, leader_address, expected_config, harness):
+    """Test generating exporter config for leader-only data collection."""
+    relation_id = harness.add_relation(
+        charm.PrometheusJujuExporterCharm.PEER_RELATION, harness.charm.app.name
+    )
+    with harness.hooks_disabled():
+        harness.update_config({"leader-only-collection": True, "scrape-port": 5000})
+        if leader_address:
+            harness.update_relation_data(
+                relation_id, harness.charm.app.name, {"leader-address": leader_address}
+            )
+        harness.set_leader(leader)
+
+    assert harness.charm._generate_replication_config() == expected_config
+
+
+def test_generate_replication_config_leader_resets_upstream(harness):
+    """Test that unit that became leader follows the next leader once it loses leadership."""
+    harness.charm._stored.replication_upstream = "http://10.0.0.2:5000"
+    with harness.hooks_disabled():
+        harness.set_leader(True)
+
+    assert harness.charm._generate_replication_config() == {"role": "leader"}
+    assert harness.charm._stored.replication_upstream is None
+
+
+def test_generate_exporter_config_leader_only(harness, mocker):
+    """Test that replication config is included only when leader-only collection is enabled."""
+    mocker.patch.object(harness.charm, "get_controller_ca", return_value="ca")
+    mocker.patch.object(
+        harness.charm, "_generate_replication_config", return_value={"role": "leader"}
+    )
+
+    assert "replication" not in harness.charm.generate_exporter_config()
+
+    with harness.hooks_disabled():
+        harness.update_config({"leader-only-collection": True})
+
+    assert harness.charm.generate_exporter_config()["replication"] == {"role": "leader"}
+
+
+@pytest.mark.parametrize("leader", [True, False])
+def test_publish_leader_address(leader, harness, mocker):
+    """Test that only leader publishes its address in the peer relation."""
+    address = "10.0.0.1"
+    mocker.patch.object(charm.hookenv, "unit_private_ip", return_value=address)
+    relation_id = harness.add_relation(
+        charm.PrometheusJujuExporterCharm.PEER_RELATION, harness.charm.app.name
+    )
+    with harness.hooks_disabled():
+        harness.set_leader(leader)
+
+    harness.charm._publish_leader_address()
+
+    app_data = harness.get_relation_data(relation_id, harness.charm.app.name)
+    if leader:
+        assert app_data["leader-address"] == address
+    else:
+        assert "leader-address" not in app_data
+
+
+@pytest.mark.parametrize("leader_only", [True, False])
+def test_on_leader_elected(leader_only, harness, mocker):
+    """Test that new leader publishes its address and takes over data collection."""
+    mock_publish = mocker.patch.object(harness.charm, "_publish_leader_address")
+    mock_configure = mocker.patch.object(harness.charm, "configure_exporter")
+    with harness.hooks_disabled():
+        harness.update_config({"leader-only-collection": leader_only})
+
+    harness.charm._on_leader_elected(None)
+
+    mock_publish.assert_called_once_with()
+    if leader_only:
+        mock_configure.assert_called_once_with()
+    else:
+        mock_configure.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "leader_only, leader, old_upstream, expect_reconfigure",
+    [
+        (True, False, None, True),  # standby learns about the leader
+        (True, False, "http://10.0.0.3:5000", True),  # leader changed
+        (True, False, "http://10.0.0.2:5000", False),  # leader did not change
+        (True, True, None, False),  # leader does not replicate data
+        (False, False, None, False),  # leader-only collection is disabled
+    ],
+)
+def test_on_peer_relation_changed(
+    leader_only, leader, old_upstream, expect_reconfigure, harness, mocker
+):
+    """Test that standby units reconfigure exporter only if the leader changes."""
+    mock_configure = mocker.patch.object(harness.charm, "configure_exporter")
+    relation_id = harness.add_relation(
+        charm.PrometheusJujuExporterCharm.PEER_RELATION, harness.charm.app.name
+    )
+    with harness.hooks_disabled():
+        harness.update_config({"leader-only-collection": leader_only, "scrape-port": 5000})
+        harness.update_relation_data(
+            relation_id, harness.charm.app.name, {"leader-address": "10.0.0.2"}
+        )
+        harness.set_leader(leader)
+    harness.charm._stored.replication_upstream = old_upstream
+
+    harness.charm._on_peer_relation_changed(None)
+
+    if expect_reconfigure:
+        mock_configure.assert_called_once_with()
+        assert harness.charm._stored.replication_upstream == "http://10.0.0.2:5000"
+    else:
+        mock_configure.assert_not_called()
+
+
+def add_peer_units(harness, unit_data):
+    """Add peer relation with remote units and their data. Return relation ID."""
+    app_name = harness.charm.app.name
+    relation_id = harness.add_relation(charm.PrometheusJujuExporterCharm.PEER_RELATION, app_name)
+    for unit_name, data in unit_data.items():
+        if unit_name != harness.charm.unit.name:
+            harness.add_relation_unit(relation_id, unit_name)
+        harness.update_relation_data(relation_id, unit_name, data)
+
+    return relation_id
+
+
+@pytest.mark.parametrize(
+    "batch_size, peers, expected",
+    [
+        (0, ["prometheus-juju-exporter/1"], False),
+        (1, [], False),
+        (1, ["prometheus-juju-exporter/1"], True),
+    ],
+)
+def test_rolling_restart(batch_size, peers, expected, harness):
+    """Test that rolling restarts are coordinated only if there are multiple units."""
+    with harness.hooks_disabled():
+        harness.update_config({"restart-batch-size": batch_size})
+        add_peer_units(harness, {peer: {} for peer in peers})
+
+    assert (harness.charm._rolling_restart is not None) == expected
+
+
+@pytest.mark.parametrize(
+    "valid, restart_pending, expected_status",
+    [
+        (True, True, charm.MaintenanceStatus("Waiting for rolling restart.")),
+        (True, False, charm.ActiveStatus("Unit is ready")),
+        (False, False, charm.BlockedStatus("Invalid configuration. Please see logs.")),
+    ],
+)
+def test_configure_exporter_rolling_restart(
+    valid, restart_pending, expected_status, harness, mocker
+):
+    """Test that with rolling restarts, config is only validated and restart is requested.
+
+    Related applications and unit's status are updated even if restart is not needed.
+    """
+    exporter_config = {"valid": "config"}
+    mocker.patch.object(harness.charm, "generate_exporter_config", return_value=exporter_config)
+    mock_rolling_restart = mock.MagicMock()
+    mock_rolling_restart.request.return_value = restart_pending
+    mocker.patch.object(
+        type(harness.charm),
+        "_rolling_restart",
+        new_callable=mock.PropertyMock,
+        return_value=mock_rolling_restart,
+    )
+    mock_validate = mocker.patch.object(harness.charm.exporter, "validate_config")
+    mock_apply = mocker.patch.object(harness.charm, "apply_exporter_config")
+    mock_continue = mocker.patch.object(harness.charm, "_continue_rolling_restart")
+    mock_scrape_target = mocker.patch.object(harness.charm, "reconfigure_scrape_target")
+    mock_summary_target = mocker.patch.object(harness.charm, "reconfigure_summary_scrape_target")
+    mocker.patch.object(harness.charm, "reconfigure_open_ports")
+    if not valid:
+        mock_validate.side_effect = charm.ExporterConfigError
+
+    harness.charm.configure_exporter()
+
+    mock_validate.assert_called_once_with(exporter_config)
+    mock_apply.assert_not_called()
+    assert harness.charm.unit.status == expected_status
+    if valid:
+        token = harness.charm.config_digest(charm.ExporterSnap.render_config(exporter_config), {})
+        mock_rolling_restart.request.assert_called_once_with(token)
+        mock_scrape_target.assert_called_once_with()
+        mock_summary_target.assert_called_once_with()
+        mock_continue.assert_called_once_with(mock_rolling_restart)
+    else:
+        mock_rolling_restart.request.assert_not_called()
+        mock_scrape_target.assert_not_called()
+        mock_continue.assert_not_called()
+
+
+def test_config_digest_resource_limits(harness):
+    """Test that restart is required if only resource limits of the exporter changed."""
+    rendered_config = charm.ExporterSnap.render_config({"valid": "config"})
+    token = charm.hashlib.sha256(rendered_config.encode("utf-8")).hexdigest()
+
+    assert harness.charm.config_digest(rendered_config) == token
+    assert harness.charm.config_digest(rendered_config, {}) == token
+    assert harness.charm.config_digest(rendered_config, {"Nice": "10"}) != token
+
+
+@pytest.mark.parametrize(
+    "granted, applied, ready, expected_finished",
+    [
+        (True, True, True, True),
+        (True, True, False, False),
+        (True, False, True, False),  # New config could not be applied
+        (False, True, True, None),
+    ],
+)
+def test_continue_rolling_restart(granted, applied, ready, expected_finished, harness, mocker):
+    """Test that unit restarts exporter only when leader grants it."""
+    mocker.patch.object(harness.charm, "generate_exporter_config", return_value={})
+    mock_apply = mocker.patch.object(harness.charm, "apply_exporter_config", return_value=applied)
+    mock_wait = mocker.patch.object(
+        harness.charm.exporter, "wait_for_snapshot", return_value=ready
+    )
+    mock_rolling_restart = mock.MagicMock()
+    mock_rolling_restart.granted_restart.return_value = "a" if granted else None
+    with harness.hooks_disabled():
+        harness.update_config({"restart-batch-size": 2})
+
+    harness.charm._continue_rolling_restart(mock_rolling_restart)
+
+    if expected_finished is None:
+        mock_rolling_restart.update_grants.assert_called_once_with(2)
+        mock_apply.assert_not_called()
+        mock_rolling_restart.finish.assert_not_called()
+        return
+
+    mock_apply.assert_called_once_with({})
+    if applied:
+        mock_wait.assert_called_once_with(
+            harness.charm.config["scrape-port"], harness.charm.RESTART_READY_TIMEOUT
+        )
+    else:
+        mock_wait.assert_not_called()
+    mock_rolling_restart.finish.assert_called_once_with("a", expected_finished)
+    # Finished restart lets the leader grant restart to the next batch
+    assert mock_rolling_restart.update_grants.call_args_list == [mock.call(2), mock.call(2)]
+    if applied and not ready:
+        assert isinstance(harness.charm.unit.status, charm.BlockedStatus)
+
+
+@pytest.mark.parametrize(
+    "peers, expect_restart", [(["prometheus-juju-exporter/1"], True), ([], False)]
+)
+def test_on_peer_relation_changed_rolling_restart(peers, expect_restart, harness, mocker):
+    """Test that units continue rolling restart when peer relation data change."""
+    mock_continue = mocker.patch.object(harness.charm, "_continue_rolling_restart")
+    with harness.hooks_disabled():
+        harness.update_config({"restart-batch-size": 1})
+        add_peer_units(harness, {peer: {} for peer in peers})
+
+    harness.charm._on_peer_relation_changed(None)
+
+    assert mock_continue.called == expect_restart
+
+
 @pytest.mark.parametrize("error", [True, False])
 def test_reconfigure_scrape_target(error, harness, mocker):
     """Test updating scrape target of Prometheus."""
@@ -209,6 +694,260 @@ def test_reconfigure_scrape_target(error, harness, mocker):
         )
 
 
+@pytest.mark.parametrize(
+    "auto_tune, render, collect, expected_timeout, expected_interval",
+    [
+        (False, 100.0, 30.0, 30, 15),  # measurements are ignored without auto-tune
+        (True, None, None, 30, 15),  # nothing measured yet
+        (True, 1.0, None, 30, 15),  # fast render, unknown collection duration
+        (True, 20.0, None, 60, 15),  # slow render raises timeout
+        (True, 1.0, 30.0, 30, 2),  # fast collection shortens interval
+        (True, 1.0, 1000.0, 30, 15),  # configured interval is upper limit
+        (True, 200.0, 10.0, 600, 10),  # interval can't be shorter than timeout
+    ],
+)
+def test_tuned_scrape_parameters(
+    auto_tune, render, collect, expected_timeout, expected_interval, harness
+):
+    """Test calculation of scrape timeout and interval based on measured durations."""
+    with harness.hooks_disabled():
+        harness.update_config(
+            {"scrape-auto-tune": auto_tune, "scrape-interval": 15, "scrape-timeout": 30}
+        )
+    harness.charm._stored.render_seconds = render
+    harness.charm._stored.collect_seconds = collect
+
+    assert harness.charm.scrape_timeout == expected_timeout
+    assert harness.charm.scrape_interval == expected_interval
+
+
+@pytest.mark.parametrize(
+    "auto_tune, render, collect, expected_timeout",
+    [
+        (False, None, None, 900),  # collection not measured yet, allow the whole interval
+        (False, 5.0, 15.0, 60),  # collection duration is part of the scrape in on-demand mode
+        (True, None, 15.0, 45),  # full render was never measured
+        (False, None, 5.0, 30),  # configured timeout is a lower limit
+    ],
+)
+def test_scrape_timeout_on_demand(auto_tune, render, collect, expected_timeout, harness):
+    """Test that scrape timeout accommodates data collection in 'on-demand' mode."""
+    with harness.hooks_disabled():
+        harness.update_config(
+            {
+                "collect-mode": "on-demand",
+                "scrape-auto-tune": auto_tune,
+                "scrape-interval": 15,
+                "scrape-timeout": 30,
+            }
+        )
+    harness.charm._stored.render_seconds = render
+    harness.charm._stored.collect_seconds = collect
+
+    assert harness.charm.scrape_timeout == expected_timeout
+
+
+def test_generate_exporter_config_tuned_interval(harness, mocker):
+    """Test that automatically tuned interval is used as exporter's collection interval."""
+    mocker.patch.object(harness.charm, "get_controller_ca", return_value="ca")
+    with harness.hooks_disabled():
+        harness.update_config({"scrape-auto-tune": True, "scrape-interval": 15})
+    harness.charm._stored.collect_seconds = 30.0
+
+    snap_config = harness.charm.generate_exporter_config()
+
+    assert snap_config["exporter"]["collect_interval"] == 2
+
+
+@pytest.mark.parametrize(
+    "collect, interval_changed",
+    [
+        (None, False),  # Exporter does not report collection duration
+        (30.0, True),  # Collection is fast enough to shorten interval
+    ],
+)
+def test_tune_scrape_parameters(collect, interval_changed, harness, mocker):
+    """Test that scrape parameters are updated based on measured exporter performance."""
+    stats = ScrapeStats(render_seconds=20.0, collect_seconds=collect)
+    mock_measure = mocker.patch.object(
+        harness.charm.exporter, "measure_scrape", return_value=stats
+    )
+    mock_configure = mocker.patch.object(harness.charm, "configure_exporter")
+    mock_reconfigure = mocker.patch.object(harness.charm, "reconfigure_scrape_target")
+    mock_reconfigure_summary = mocker.patch.object(
+        harness.charm, "reconfigure_summary_scrape_target"
+    )
+    with harness.hooks_disabled():
+        harness.update_config({"scrape-auto-tune": True, "scrape-timeout": 30})
+
+    harness.charm.tune_scrape_parameters()
+
+    mock_measure.assert_called_once_with(
+        harness.charm.config["scrape-port"], harness.charm.MEASURE_SCRAPE_TIMEOUT, "/metrics"
+    )
+    assert harness.charm._stored.render_seconds == stats.render_seconds
+    assert harness.charm._stored.collect_seconds == stats.collect_seconds
+    if interval_changed:
+        mock_configure.assert_called_once_with()
+    else:
+        mock_configure.assert_not_called()
+    mock_reconfigure.assert_called_once_with()
+    mock_reconfigure_summary.assert_called_once_with()
+
+
+def test_tune_scrape_parameters_invalid_config(harness, mocker):
+    """Test that invalid config found during tuning blocks the unit instead of failing hook."""
+    stats = ScrapeStats(render_seconds=20.0, collect_seconds=30.0)
+    mocker.patch.object(harness.charm.exporter, "measure_scrape", return_value=stats)
+    mocker.patch.object(harness.charm, "generate_exporter_config", return_value={})
+    mocker.patch.object(harness.charm.exporter, "configure_resources", return_value=False)
+    mocker.patch.object(
+        harness.charm.exporter, "apply_config", side_effect=charm.ExporterConfigError
+    )
+    mocker.patch.object(harness.charm, "reconfigure_scrape_target")
+    with harness.hooks_disabled():
+        harness.update_config({"scrape-auto-tune": True})
+
+    harness.charm.tune_scrape_parameters()
+
+    assert harness.charm._stored.applied_config_hash is None
+    assert isinstance(harness.charm.unit.status, charm.BlockedStatus)
+
+
+def test_tune_scrape_parameters_on_demand(harness, mocker):
+    """Test that in on-demand mode, measurement does not trigger data collection."""
+    stats = ScrapeStats(render_seconds=0.1, collect_seconds=50.0)
+    mock_measure = mocker.patch.object(
+        harness.charm.exporter, "measure_scrape", return_value=stats
+    )
+    mock_reconfigure = mocker.patch.object(harness.charm, "reconfigure_scrape_target")
+    mocker.patch.object(harness.charm, "reconfigure_summary_scrape_target")
+    with harness.hooks_disabled():
+        harness.update_config(
+            {"collect-mode": "on-demand", "scrape-interval": 15, "scrape-timeout": 30}
+        )
+
+    harness.charm.tune_scrape_parameters()
+
+    # Until the collection is measured, timeout allows the scrape to take the whole interval
+    mock_measure.assert_called_once_with(
+        harness.charm.config["scrape-port"], 15 * 60, "/metrics/summary"
+    )
+    # Latency of the summary endpoint is not mistaken for rendering of the full metrics
+    assert harness.charm._stored.render_seconds is None
+    assert harness.charm.scrape_timeout == 150
+    mock_reconfigure.assert_called_once_with()
+
+
+def test_tune_scrape_parameters_unreachable(harness, mocker):
+    """Test that nothing changes if exporter can't be scraped."""
+    mocker.patch.object(
+        harness.charm.exporter, "measure_scrape", side_effect=charm.ExporterScrapeError
+    )
+    mock_reconfigure = mocker.patch.object(harness.charm, "reconfigure_scrape_target")
+
+    harness.charm.tune_scrape_parameters()
+
+    assert harness.charm._stored.render_seconds is None
+    mock_reconfigure.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "auto_tune, mode, status, expect_tuning",
+    [
+        (True, "interval", charm.ActiveStatus(), True),
+        (False, "interval", charm.ActiveStatus(), False),
+        (False, "on-demand", charm.ActiveStatus(), True),
+        (True, "interval", charm.BlockedStatus("Invalid configuration."), False),
+    ],
+)
+def test_on_update_status(auto_tune, mode, status, expect_tuning, harness, mocker):
+    """Test that scrape parameters are tuned only when needed and unit is active."""
+    mock_tune = mocker.patch.object(harness.charm, "tune_scrape_parameters")
+    with harness.hooks_disabled():
+        harness.update_config({"scrape-auto-tune": auto_tune, "collect-mode": mode})
+    harness.charm.unit.status = status
+
+    harness.charm._on_update_status(None)
+
+    if expect_tuning:
+        mock_tune.assert_called_once_with()
+    else:
+        mock_tune.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "interval, timeout, expected_timeout",
+    [
+        (30, 10, 10),
+        (30, 60, 30),  # timeout can't be longer than interval
+    ],
+)
+def test_reconfigure_summary_scrape_target(interval, timeout, expected_timeout, harness, mocker):
+    """Test updating summary scrape target of Prometheus."""
+    port = 5000
+    expose_target_mock = mocker.patch.object(
+        harness.charm.prometheus_summary_target, "expose_scrape_target"
+    )
+    with harness.hooks_disabled():
+        harness.update_config(
+            {
+                "scrape-port": port,
+                "summary-scrape-interval": interval,
+                "scrape-timeout": timeout,
+            }
+        )
+
+    harness.charm.reconfigure_summary_scrape_target()
+
+    expose_target_mock.assert_called_once_with(
+        port,
+        "/metrics/summary",
+        scrape_interval=f"{interval}s",
+        scrape_timeout=f"{expected_timeout}s",
+    )
+
+
+@pytest.mark.parametrize("interval", [0, -30])
+def test_reconfigure_summary_scrape_target_invalid_interval(interval, harness, mocker):
+    """Test that invalid summary scrape interval is not published to Prometheus."""
+    expose_target_mock = mocker.patch.object(
+        harness.charm.prometheus_summary_target, "expose_scrape_target"
+    )
+    with harness.hooks_disabled():
+        harness.update_config({"summary-scrape-interval": interval})
+
+    harness.charm.reconfigure_summary_scrape_target()
+
+    expose_target_mock.assert_not_called()
+
+
+def test_configure_exporter_invalid_summary_interval(harness, mocker):
+    """Test that invalid summary scrape interval blocks the unit."""
+    mock_generate = mocker.patch.object(harness.charm, "generate_exporter_config")
+    mock_apply = mocker.patch.object(harness.charm, "apply_exporter_config")
+    with harness.hooks_disabled():
+        harness.update_config({"summary-scrape-interval": 0})
+
+    harness.charm.configure_exporter()
+
+    mock_generate.assert_not_called()
+    mock_apply.assert_not_called()
+    assert isinstance(harness.charm.unit.status, charm.BlockedStatus)
+
+
+def test_reconfigure_summary_scrape_target_error(harness, mocker):
+    """Test that error is re-raised if summary scrape target configuration fails."""
+    mocker.patch.object(
+        harness.charm.prometheus_summary_target,
+        "expose_scrape_target",
+        side_effect=charm.PrometheusConfigError,
+    )
+
+    with pytest.raises(charm.PrometheusConfigError):
+        harness.charm.reconfigure_summary_scrape_target()
+
+
 def test_reconfigure_open_ports(harness, mocker):
     """Test updating which ports are open on units."""
     old_port_spec = "5000/tcp"
@@ -248,13 +987,15 @@ def test_on_config_changed_incomplete(harness, mocker):
     """Test what happens when charm has incomplete configuration."""
     incomplete_config = {}
     mocker.patch.object(harness.charm, "generate_exporter_config", return_value=incomplete_config)
+    mocker.patch.object(harness.charm.exporter, "configure_resources")
     mock_apply_config = mocker.patch.object(
         harness.charm.exporter, "apply_config", side_effect=charm.ExporterConfigError
     )
 
     harness.charm._on_config_changed(None)
 
-    mock_apply_config.assert_called_once_with(incomplete_config)
+    mock_apply_config.assert_called_once_with(incomplete_config, mock.ANY)
+    assert harness.charm._stored.applied_config_hash is None
     assert isinstance(harness.charm.unit.status, charm.BlockedStatus)
 
 
@@ -262,19 +1003,160 @@ def test_on_config_changed_success(mocker, harness):
     """Test successful application of new config values."""
     valid_config = {"valid": "config"}
     mocker.patch.object(harness.charm, "generate_exporter_config", return_value=valid_config)
+    mock_configure_resources = mocker.patch.object(
+        harness.charm.exporter, "configure_resources", return_value=False
+    )
     mock_apply_config = mocker.patch.object(harness.charm.exporter, "apply_config")
     mock_reconfigure_scrape = mocker.patch.object(harness.charm, "reconfigure_scrape_target")
+    mock_reconfigure_summary = mocker.patch.object(
+        harness.charm, "reconfigure_summary_scrape_target"
+    )
     mock_reconfigure_ports = mocker.patch.object(harness.charm, "reconfigure_open_ports")
 
     harness.charm._on_config_changed(None)
 
-    mock_apply_config.assert_called_once_with(valid_config)
+    rendered_config = charm.ExporterSnap.render_config(valid_config)
+    mock_configure_resources.assert_called_once_with({})
+    mock_apply_config.assert_called_once_with(valid_config, rendered_config)
+    assert harness.charm._stored.applied_config_hash == harness.charm.config_digest(
+        rendered_config
+    )
     mock_reconfigure_scrape.assert_called_once_with()
+    mock_reconfigure_summary.assert_called_once_with()
     mock_reconfigure_ports.assert_called_once_with()
 
     assert isinstance(harness.charm.unit.status, charm.ActiveStatus)
 
 
+@pytest.mark.parametrize(
+    "config_changed, resources_changed, expect_apply",
+    [
+        (False, False, False),
+        (True, False, True),
+        (False, True, True),
+    ],
+)
+def test_apply_exporter_config_unchanged(
+    config_changed, resources_changed, expect_apply, harness, mocker
+):
+    """Test that exporter is restarted only if its config or resource limits changed."""
+    exporter_config = {"exporter": {"port": 5000}}
+    applied_config = {"exporter": {"port": 5001}} if config_changed else exporter_config
+    rendered_config = charm.ExporterSnap.render_config(applied_config)
+    harness.charm._stored.applied_config_hash = harness.charm.config_digest(rendered_config)
+    mocker.patch.object(
+        harness.charm.exporter, "configure_resources", return_value=resources_changed
+    )
+    mock_apply_config = mocker.patch.object(harness.charm.exporter, "apply_config")
+    mocker.patch.object(harness.charm, "reconfigure_scrape_target")
+    mocker.patch.object(harness.charm, "reconfigure_summary_scrape_target")
+    mocker.patch.object(harness.charm, "reconfigure_open_ports")
+
+    assert harness.charm.apply_exporter_config(exporter_config)
+
+    if expect_apply:
+        mock_apply_config.assert_called_once_with(exporter_config, mock.ANY)
+    else:
+        mock_apply_config.assert_not_called()
+    assert isinstance(harness.charm.unit.status, charm.ActiveStatus)
+
+
+def test_on_config_changed_invalid_resource_limits(harness, mocker):
+    """Test that invalid resource limits block the unit without touching the exporter."""
+    mocker.patch.object(harness.charm, "generate_exporter_config", return_value={})
+    mock_configure_resources = mocker.patch.object(harness.charm.exporter, "configure_resources")
+    mock_apply_config = mocker.patch.object(harness.charm.exporter, "apply_config")
+    with harness.hooks_disabled():
+        harness.update_config({"nice-level": 20})
+
+    harness.charm._on_config_changed(None)
+
+    mock_configure_resources.assert_not_called()
+    mock_apply_config.assert_not_called()
+    assert isinstance(harness.charm.unit.status, charm.BlockedStatus)
+
+
+def test_on_config_changed(harness, mocker):
+    """Test that changed configuration is applied to the exporter."""
+    mock_configure = mocker.patch.object(harness.charm, "configure_exporter")
+
+    harness.charm._on_config_changed(None)
+
+    mock_configure.assert_called_once_with()
+
+
+def test_timed_handler(harness, mocker):
+    """Test that execution of decorated event handler is recorded."""
+    mocker.patch.object(harness.charm, "configure_exporter")
+
+    harness.charm._on_config_changed(None)
+
+    timings = harness.charm.hook_timings
+    assert len(timings) == 1
+    assert timings[0]["handler"] == "_on_config_changed"
+    assert harness.charm.hook_timer is None
+
+
+def test_timed_phase(harness):
+    """Test that phases are recorded only while event handler is being timed."""
+    with harness.charm.timed_phase("untimed"):
+        pass
+
+    harness.charm.hook_timer = charm.HookTimer("_on_install")
+    with harness.charm.timed_phase("snap_install"):
+        pass
+
+    assert list(harness.charm.hook_timer.phases) == ["snap_install"]
+
+
+@pytest.mark.parametrize("textfile", [True, False])
+def test_record_hook_timing(textfile, harness, mocker):
+    """Test that only limited number of hook timings is kept."""
+    mocker.patch.object(harness.charm, "HOOK_TIMINGS_LIMIT", 3)
+    mock_write = mocker.patch.object(harness.charm.exporter, "write_textfile")
+    with harness.hooks_disabled():
+        harness.update_config({"hook-timings-textfile": textfile})
+
+    for index in range(5):
+        timer = charm.HookTimer(f"handler_{index}")
+        timer.stop()
+        harness.charm.record_hook_timing(timer)
+
+    handlers = [record["handler"] for record in harness.charm.hook_timings]
+    assert handlers == ["handler_2", "handler_3", "handler_4"]
+    if textfile:
+        assert mock_write.call_count == 5
+    else:
+        mock_write.assert_not_called()
+
+
+def test_record_hook_timing_textfile_error(harness, mocker):
+    """Test that failure to write textfile does not fail the hook."""
+    mocker.patch.object(harness.charm.exporter, "write_textfile", side_effect=PermissionError)
+    with harness.hooks_disabled():
+        harness.update_config({"hook-timings-textfile": True})
+
+    timer = charm.HookTimer("_on_install")
+    timer.stop()
+    harness.charm.record_hook_timing(timer)
+
+    assert len(harness.charm.hook_timings) == 1
+
+
+def test_on_show_hook_timings_action(harness, mocker):
+    """Test that action returns recorded hook timings."""
+    timings = [{"handler": "_on_install", "duration": 1.0, "phases": {}}]
+    mocker.patch.object(
+        type(harness.charm), "hook_timings", new_callable=mock.PropertyMock, return_value=timings
+    )
+    event = mock.MagicMock()
+
+    harness.charm._on_show_hook_timings_action(event)
+
+    expected_results = {"timings": yaml.safe_dump(timings, sort_keys=False)}
+    event.set_results.assert_called_once_with(expected_results)
+
+
 def test_on_prometheus_available(harness, mocker):
     """Test that handler for 'prometheus_available' reconfigures scrape target."""
     mock_reconfigure = mocker.patch.object(harness.charm, "reconfigure_scrape_target")
@@ -282,3 +1164,12 @@ def test_on_prometheus_available(harness, mocker):
     harness.charm._on_prometheus_available(None)
 
     mock_reconfigure.assert_called_once_with()
+
+
+def test_on_prometheus_summary_available(harness, mocker):
+    """Test that handler for summary 'prometheus_available' reconfigures summary target."""
+    mock_reconfigure = mocker.patch.object(harness.charm, "reconfigure_summary_scrape_target")
+
+    harness.charm._on_prometheus_summary_available(None)
+
+    mock_reconfigure.assert_called_once_with()
@@ -4,7 +4,7 @@
 # Learn more about testing at: https://juju.is/docs/sdk/testing
 """Unit tests for helper class ExporterSnap that handles actions related to the exporter snap."""
 from typing import Dict
-from unittest.mock import ANY, mock_open, patch
+from unittest.mock import ANY, call, mock_open, patch
 
 import pytest
 
@@ -77,6 +77,77 @@ def test_validate_config_refresh_below_zero():
     validate_config_error({"exporter": {"collect_interval": 0}}, expected_err)
 
 
+@pytest.mark.parametrize(
+    "value, expected_error",
+    [
+        ("foo", "Configuration option 'exporter.max_connections' must be a number."),
+        (0, "Configuration option 'exporter.max_connections' must be a positive number."),
+    ],
+)
+def test_validate_config_positive_int(value, expected_error):
+    """Test config validation of options that must be positive integers."""
+    validate_config_error({"exporter": {"max_connections": value}}, expected_error)
+
+
+@pytest.mark.parametrize(
+    "value, expected_error",
+    [
+        ("foo", "Configuration option 'juju.rate_limit' must be a number."),
+        (-0.5, "Configuration option 'juju.rate_limit' must be a positive number."),
+    ],
+)
+def test_validate_config_positive_float(value, expected_error):
+    """Test config validation of options that must be positive fractional numbers."""
+    validate_config_error({"juju": {"rate_limit": value}}, expected_error)
+
+
+@pytest.mark.parametrize("url", ["prometheus:9090/api/v1/write", "ftp://prometheus/", "http://"])
+def test_validate_config_bad_url(url):
+    """Test config validation of options that must be HTTP(S) URLs."""
+    expected_error = (
+        "Configuration option 'exporter.remote_write.url' must be a valid HTTP(S) URL."
+    )
+    validate_config_error({"exporter": {"remote_write": {"url": url}}}, expected_error)
+
+
+def test_validate_config_collector_budget():
+    """Test config validation of collector's time budget."""
+    expected_error = "Configuration option 'collectors.units.budget' must be a positive number."
+    validate_config_error({"collectors": {"units": {"budget": -1}}}, expected_error)
+
+
+def test_validate_config_model_discovery():
+    """Test config validation of model catalogue options."""
+    expected_error = (
+        "Configuration option 'juju.model_discovery' must be one of: watch, list. Got 'poll'."
+    )
+    validate_config_error({"juju": {"model_discovery": "poll"}}, expected_error)
+    expected_error = "Configuration option 'juju.model_list_interval' must be a positive number."
+    validate_config_error({"juju": {"model_list_interval": -5}}, expected_error)
+
+
+@pytest.mark.parametrize(
+    "value, expected_error",
+    [
+        ("foo", "Configuration option 'exporter.tracing.sample_rate' must be a number."),
+        (0, "Configuration option 'exporter.tracing.sample_rate' must be a positive number."),
+        (1.5, "Configuration option 'exporter.tracing.sample_rate' must not be greater than 1."),
+    ],
+)
+def test_validate_config_bad_fraction(value, expected_error):
+    """Test config validation of options that must be fractions."""
+    validate_config_error({"exporter": {"tracing": {"sample_rate": value}}}, expected_error)
+
+
+def test_validate_config_bad_choice():
+    """Test config validation of an option with unsupported value."""
+    expected_error = (
+        "Configuration option 'exporter.collect_mode' must be one of: interval, on-demand. "
+        "Got 'foo'."
+    )
+    validate_config_error({"exporter": {"collect_mode": "foo"}}, expected_error)
+
+
 def test_validate_config():
     """Test positively validating snap exporter config."""
     config = {
@@ -84,12 +155,40 @@ def test_validate_config():
         "exporter": {
             "port": 5000,
             "collect_interval": 5,
+            "max_connections": 16,
+            "collect_mode": "on-demand",
+            "cache_ttl": 300,
+            "metadata_refresh_interval": 360,
+            "query_api": {"enabled": True, "max_page_size": 500},
+            "remote_write": {
+                "url": "https://prometheus:9090/api/v1/write",
+                "batch_size": 5000,
+                "queue_size": 100000,
+                "max_retries": 5,
+            },
+            "tracing": {
+                "sample_rate": 0.1,
+                "format": "chrome",
+                "max_file_size": 10,
+                "max_files": 5,
+                "path": "/var/snap/prometheus-juju-exporter/common/traces",
+            },
         },
         "juju": {
             "controller_endpoint": "10.0.0.99:17070",
             "controller_cacert": "CA CERT DATA",
             "username": "foo",
             "password": "bar",
+            "rate_limit": 0.5,
+            "max_in_flight": 4,
+            "adaptive_backoff": True,
+            "model_discovery": "watch",
+            "model_list_interval": 10,
+            "skip_unavailable_models": True,
+        },
+        "collectors": {
+            "units": {"enabled": True, "interval": 5, "budget": 30},
+            "applications": {"enabled": False, "interval": 15, "budget": 60},
         },
     }
 
@@ -110,7 +209,9 @@ def test_apply_config(failed, mocker):
     """
     mock_stop = mocker.patch.object(exporter.ExporterSnap, "stop")
     mock_start = mocker.patch.object(exporter.ExporterSnap, "start")
-    mock_dump = mocker.patch.object(exporter.yaml, "safe_dump")
+    mock_render = mocker.patch.object(
+        exporter.ExporterSnap, "render_config", return_value="valid: config\n"
+    )
     mock_validate = mocker.patch.object(exporter.ExporterSnap, "validate_config")
     config = {"valid": "config"}
     exporter_ = exporter.ExporterSnap()
@@ -123,7 +224,7 @@ def test_apply_config(failed, mocker):
 
         mock_stop.assert_called_once_with()
         mock_validate.assert_called_once_with(config)
-        mock_dump.assert_not_called()
+        mock_render.assert_not_called()
         mock_start.assert_not_called()
 
     else:
@@ -132,11 +233,45 @@ def test_apply_config(failed, mocker):
 
             mock_stop.assert_called_once_with()
             mock_validate.assert_called_once_with(config)
-            mock_dump.assert_called_once_with(config, ANY)
+            mock_render.assert_called_once_with(config)
             file_.assert_called_once_with(exporter_.SNAP_CONFIG_PATH, "w", encoding="utf-8")
+            file_().write.assert_called_once_with("valid: config\n")
             mock_start.assert_called_once_with()
 
 
+def test_apply_config_prerendered(mocker):
+    """Test that already rendered config is written to the config file as is."""
+    mocker.patch.object(exporter.ExporterSnap, "stop")
+    mocker.patch.object(exporter.ExporterSnap, "start")
+    mocker.patch.object(exporter.ExporterSnap, "validate_config")
+    mock_render = mocker.patch.object(exporter.ExporterSnap, "render_config")
+
+    with patch("builtins.open", new_callable=mock_open) as file_:
+        exporter.ExporterSnap().apply_config({"valid": "config"}, "valid: config\n")
+
+    mock_render.assert_not_called()
+    file_().write.assert_called_once_with("valid: config\n")
+
+
+def test_render_config():
+    """Test that config is rendered deterministically, regardless of the order of keys."""
+    config = {"juju": {"username": "foo", "password": "bar"}, "exporter": {"port": 5000}}
+    reordered_config = {"exporter": {"port": 5000}, "juju": {"password": "bar", "username": "foo"}}
+    expected_rendered = "exporter:\n  port: 5000\njuju:\n  password: bar\n  username: foo\n"
+
+    assert exporter.ExporterSnap.render_config(config) == expected_rendered
+    assert exporter.ExporterSnap.render_config(reordered_config) == expected_rendered
+
+
+def test_option_path():
+    """Test splitting of dot-separated option names."""
+    assert exporter.option_path("exporter.remote_write.url") == (
+        "exporter",
+        "remote_write",
+        "url",
+    )
+
+
 @pytest.mark.parametrize(
     "action",
     [
@@ -177,3 +312,142 @@ def test_execute_service_action_unknownw(mocker):
         exporter_._execute_service_action(bad_action)
 
     mock_call.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "metrics, expected_duration",
+    [
+        ("juju_machine_state{hostname='foo'} 1.0\n", None),
+        ("juju_exporter_collect_duration_seconds 12.5\n", 12.5),
+        ('juju_exporter_collect_duration_seconds{customer="foo"} 3.0\n', 3.0),
+        ("juju_exporter_collect_duration_seconds_count 3.0\n", None),
+        ("juju_exporter_collect_duration_seconds NaN-ish\n", None),
+    ],
+)
+def test_measure_scrape(metrics, expected_duration, mocker):
+    """Test measuring cost of exporter scrape."""
+    port = 5000
+    timeout = 30
+    mock_response = mocker.MagicMock()
+    mock_response.__enter__.return_value.read.return_value = metrics.encode("utf-8")
+    mock_urlopen = mocker.patch.object(
+        exporter.urllib.request, "urlopen", return_value=mock_response
+    )
+    mocker.patch.object(exporter.time, "monotonic", side_effect=[10.0, 12.0])
+
+    stats = exporter.ExporterSnap().measure_scrape(port, timeout)
+
+    mock_urlopen.assert_called_once_with(f"http://localhost:{port}/metrics", timeout=timeout)
+    assert stats.render_seconds == 2.0
+    assert stats.collect_seconds == expected_duration
+
+
+def test_measure_scrape_path(mocker):
+    """Test measuring cost of scrape of a specific metrics endpoint."""
+    mock_response = mocker.MagicMock()
+    mock_response.__enter__.return_value.read.return_value = b""
+    mock_urlopen = mocker.patch.object(
+        exporter.urllib.request, "urlopen", return_value=mock_response
+    )
+
+    exporter.ExporterSnap().measure_scrape(5000, 30, "/metrics/summary")
+
+    mock_urlopen.assert_called_once_with("http://localhost:5000/metrics/summary", timeout=30)
+
+
+def test_measure_scrape_unreachable(mocker):
+    """Test that failure to reach exporter raises ExporterScrapeError."""
+    mocker.patch.object(exporter.urllib.request, "urlopen", side_effect=ConnectionRefusedError)
+
+    with pytest.raises(exporter.ExporterScrapeError):
+        exporter.ExporterSnap().measure_scrape(5000, 30)
+
+
+def test_write_textfile(mocker):
+    """Test that textfile is written to temporary file and then moved to its final path."""
+    mock_replace = mocker.patch.object(exporter.os, "replace")
+    exporter_ = exporter.ExporterSnap()
+    tmp_path = f"{exporter_.TEXTFILE_PATH}.tmp"
+
+    with patch("builtins.open", new_callable=mock_open) as file_:
+        exporter_.write_textfile("metric 1.0\n")
+
+    file_.assert_called_once_with(tmp_path, "w", encoding="utf-8")
+    file_().write.assert_called_once_with("metric 1.0\n")
+    mock_replace.assert_called_once_with(tmp_path, exporter_.TEXTFILE_PATH)
+
+
+@pytest.mark.parametrize(
+    "directives, current_content, expected_content",
+    [
+        ({"Nice": "10", "CPUQuota": "50%"}, "", "[Service]\nCPUQuota=50%\nNice=10\n"),
+        ({"Nice": "10"}, "[Service]\nCPUQuota=50%\n", "[Service]\nNice=10\n"),
+    ],
+)
+def test_configure_resources(directives, current_content, expected_content, mocker):
+    """Test that resource limits are written to systemd drop-in file."""
+    mocker.patch.object(exporter.os, "linesep", "\n")
+    mocker.patch.object(exporter.os.path, "exists", return_value=bool(current_content))
+    mock_makedirs = mocker.patch.object(exporter.os, "makedirs")
+    mock_call = mocker.patch.object(exporter.subprocess, "call")
+    exporter_ = exporter.ExporterSnap()
+
+    with patch("builtins.open", new_callable=mock_open, read_data=current_content) as file_:
+        assert exporter_.configure_resources(directives)
+
+    file_.assert_called_with(exporter_.SYSTEMD_DROPIN_PATH, "w", encoding="utf-8")
+    file_().write.assert_called_once_with(expected_content)
+    mock_makedirs.assert_called_once_with(ANY, exist_ok=True)
+    mock_call.assert_called_once_with(["systemctl", "daemon-reload"])
+
+
+def test_configure_resources_unchanged(mocker):
+    """Test that unchanged resource limits do not trigger systemd reload."""
+    mocker.patch.object(exporter.os, "linesep", "\n")
+    mocker.patch.object(exporter.os.path, "exists", return_value=True)
+    mock_call = mocker.patch.object(exporter.subprocess, "call")
+    exporter_ = exporter.ExporterSnap()
+
+    with patch("builtins.open", new_callable=mock_open, read_data="[Service]\nNice=10\n"):
+        assert not exporter_.configure_resources({"Nice": "10"})
+
+    mock_call.assert_not_called()
+
+
+def test_configure_resources_remove(mocker):
+    """Test that drop-in file is removed when resources are no longer limited."""
+    mocker.patch.object(exporter.os.path, "exists", return_value=True)
+    mock_remove = mocker.patch.object(exporter.os, "remove")
+    mock_call = mocker.patch.object(exporter.subprocess, "call")
+    exporter_ = exporter.ExporterSnap()
+
+    with patch("builtins.open", new_callable=mock_open, read_data="[Service]\nNice=10\n"):
+        assert exporter_.configure_resources({})
+
+    mock_remove.assert_called_once_with(exporter_.SYSTEMD_DROPIN_PATH)
+    mock_call.assert_called_once_with(["systemctl", "daemon-reload"])
+
+
+@pytest.mark.parametrize(
+    "responses, expected_result",
+    [
+        (["juju_machine_state{hostname='foo'} 1.0\n"], True),
+        ([exporter.ExporterScrapeError, "# no data yet\n", "juju_machine_state{} 1.0\n"], True),
+        ([exporter.ExporterScrapeError] * 3, False),
+    ],
+)
+def test_wait_for_snapshot(responses, expected_result, mocker):
+    """Test waiting for exporter to serve collected data."""
+    mock_fetch = mocker.patch.object(
+        exporter.ExporterSnap, "_fetch_metrics", side_effect=responses
+    )
+    mocker.patch.object(exporter.time, "sleep")
+    # First value sets the deadline, others are checked against it before each attempt
+    mocker.patch.object(exporter.time, "monotonic", side_effect=[0, 0, 1, 2, 3])
+
+    result = exporter.ExporterSnap().wait_for_snapshot(5000, timeout=2.5)
+
+    assert result == expected_result
+    # Each attempt may use all the time remaining until the deadline
+    expected_timeouts = [2.5, 1.5, 0.5][: len(responses)]
+    assert mock_fetch.call_args_list == [call(5000, timeout) for timeout in expected_timeouts]
@@ -0,0 +1,57 @@
+# Copyright 2022 Martin Kalcok
+# See LICENSE file for licensing details.
+#
+# Learn more about testing at: https://juju.is/docs/sdk/testing
+"""Unit tests for helpers that measure duration of charm's event handlers."""
+import pytest
+
+import hook_timing
+
+
+def test_hook_timer(mocker):
+    """Test measuring duration of a handler and its phases."""
+    mocker.patch.object(hook_timing.time, "monotonic", side_effect=[0.0, 1.0, 1.5, 2.0, 3.0, 4.0])
+
+    timer = hook_timing.HookTimer("_on_config_changed")
+    with timer.phase("apply_config"):
+        pass
+    with timer.phase("apply_config"):
+        pass
+    timer.stop()
+
+    record = timer.as_dict()
+    assert record["handler"] == "_on_config_changed"
+    assert record["duration"] == 4.0
+    assert record["phases"] == {"apply_config": 1.5}
+
+
+def test_hook_timer_phase_exception(mocker):
+    """Test that phase duration is recorded even if the phase fails."""
+    mocker.patch.object(hook_timing.time, "monotonic", side_effect=[0.0, 1.0, 3.0])
+
+    timer = hook_timing.HookTimer("_on_install")
+    with pytest.raises(RuntimeError):
+        with timer.phase("snap_install"):
+            raise RuntimeError
+
+    assert timer.phases == {"snap_install": 2.0}
+
+
+def test_render_textfile():
+    """Test that only the latest execution of each handler is rendered."""
+    timings = [
+        {"handler": "_on_install", "duration": 5.0, "phases": {"snap_install": 4.5}},
+        {"handler": "_on_config_changed", "duration": 2.0, "phases": {}},
+        {"handler": "_on_config_changed", "duration": 1.0, "phases": {"apply_config": 0.5}},
+    ]
+    metric = "juju_exporter_charm_hook_duration_seconds"
+    expected_lines = [
+        f"# HELP {metric} Duration of the latest execution of charm event handlers.",
+        f"# TYPE {metric} gauge",
+        f'{metric}{{handler="_on_config_changed",phase="total"}} 1.0',
+        f'{metric}{{handler="_on_config_changed",phase="apply_config"}} 0.5',
+        f'{metric}{{handler="_on_install",phase="total"}} 5.0',
+        f'{metric}{{handler="_on_install",phase="snap_install"}} 4.5',
+    ]
+
+    assert hook_timing.render_textfile(timings) == "\n".join(expected_lines) + "\n"
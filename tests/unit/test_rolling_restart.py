@@ -0,0 +1,158 @@
+# Copyright 2022 Martin Kalcok
+# See LICENSE file for licensing details.
+#
+# Learn more about testing at: https://juju.is/docs/sdk/testing
+"""Unit tests for coordination of exporter restarts across units."""
+import json
+
+import pytest
+
+import rolling_restart
+
+PEER_RELATION = "exporter-peers"
+
+
+def setup_rolling_restart(harness, unit_data, granted=None):
+    """Add peer relation with remote units and their data. Return coordinator of the restarts."""
+    app_name = harness.charm.app.name
+    relation_id = harness.add_relation(PEER_RELATION, app_name)
+    for unit_name, data in unit_data.items():
+        if unit_name != harness.charm.unit.name:
+            harness.add_relation_unit(relation_id, unit_name)
+        harness.update_relation_data(relation_id, unit_name, data)
+    if granted is not None:
+        harness.update_relation_data(
+            relation_id, app_name, {"restart-granted": json.dumps(granted)}
+        )
+
+    relation = harness.model.get_relation(PEER_RELATION, relation_id)
+    return rolling_restart.RollingRestart(relation, harness.charm.unit, harness.charm.app)
+
+
+@pytest.mark.parametrize(
+    "unit_data, expect_request",
+    [
+        ({}, True),  # First restart
+        ({"restart-requested": "a", "restart-done": "a"}, False),  # Already restarted
+        ({"restart-requested": "b", "restart-done": "b"}, True),  # Configuration changed
+        ({"restart-requested": "a", "restart-failed": "a"}, True),  # Retry failed restart
+    ],
+)
+def test_request(unit_data, expect_request, harness):
+    """Test that unit requests restart only if it does not run with the configuration yet."""
+    unit_name = harness.charm.unit.name
+    with harness.hooks_disabled():
+        restarts = setup_rolling_restart(harness, {unit_name: unit_data})
+
+    assert restarts.request("a") == expect_request
+
+    new_unit_data = restarts.relation.data[restarts.unit]
+    assert new_unit_data.get("restart-requested") == "a"
+    if expect_request:
+        assert "restart-failed" not in new_unit_data
+
+
+@pytest.mark.parametrize(
+    "granted, unit_data, expected_granted",
+    [
+        # Nothing to restart
+        ([], {"prometheus-juju-exporter/1": {}}, []),
+        # First batch of pending units
+        (
+            [],
+            {
+                "prometheus-juju-exporter/0": {"restart-requested": "a"},
+                "prometheus-juju-exporter/1": {"restart-requested": "a"},
+                "prometheus-juju-exporter/2": {"restart-requested": "a"},
+            },
+            ["prometheus-juju-exporter/0", "prometheus-juju-exporter/1"],
+        ),
+        # Current batch did not finish yet
+        (
+            ["prometheus-juju-exporter/0", "prometheus-juju-exporter/1"],
+            {
+                "prometheus-juju-exporter/0": {"restart-requested": "a", "restart-done": "a"},
+                "prometheus-juju-exporter/1": {"restart-requested": "a"},
+                "prometheus-juju-exporter/2": {"restart-requested": "a"},
+            },
+            ["prometheus-juju-exporter/0", "prometheus-juju-exporter/1"],
+        ),
+        # Current batch finished, grant the next one
+        (
+            ["prometheus-juju-exporter/0", "prometheus-juju-exporter/1"],
+            {
+                "prometheus-juju-exporter/0": {"restart-requested": "a", "restart-done": "a"},
+                "prometheus-juju-exporter/1": {"restart-requested": "a", "restart-done": "a"},
+                "prometheus-juju-exporter/2": {"restart-requested": "a"},
+            },
+            ["prometheus-juju-exporter/2"],
+        ),
+        # Failed restart releases the grant
+        (
+            ["prometheus-juju-exporter/0", "prometheus-juju-exporter/1"],
+            {
+                "prometheus-juju-exporter/0": {"restart-requested": "a", "restart-done": "a"},
+                "prometheus-juju-exporter/1": {"restart-requested": "a", "restart-failed": "a"},
+                "prometheus-juju-exporter/2": {"restart-requested": "a"},
+            },
+            ["prometheus-juju-exporter/2"],
+        ),
+    ],
+)
+def test_update_grants(granted, unit_data, expected_granted, harness):
+    """Test that leader grants restarts in batches."""
+    with harness.hooks_disabled():
+        harness.set_leader(True)
+        restarts = setup_rolling_restart(harness, unit_data, granted)
+
+    restarts.update_grants(2)
+
+    assert restarts.granted_units == expected_granted
+
+
+def test_update_grants_not_leader(harness):
+    """Test that only leader grants restarts."""
+    with harness.hooks_disabled():
+        restarts = setup_rolling_restart(
+            harness, {"prometheus-juju-exporter/1": {"restart-requested": "a"}}
+        )
+
+    restarts.update_grants(2)
+
+    assert "restart-granted" not in restarts.relation.data[restarts.app]
+
+
+@pytest.mark.parametrize(
+    "granted, unit_data, expected_token",
+    [
+        (True, {"restart-requested": "a"}, "a"),
+        (False, {"restart-requested": "a"}, None),
+        (True, {"restart-requested": "a", "restart-done": "a"}, None),
+        (True, {"restart-requested": "a", "restart-failed": "a"}, None),
+        (True, {}, None),
+    ],
+)
+def test_granted_restart(granted, unit_data, expected_token, harness):
+    """Test that unit restarts only if it waits for restart and leader granted it."""
+    unit_name = harness.charm.unit.name
+    with harness.hooks_disabled():
+        restarts = setup_rolling_restart(
+            harness, {unit_name: unit_data}, [unit_name] if granted else []
+        )
+
+    assert restarts.granted_restart() == expected_token
+
+
+@pytest.mark.parametrize("success, marker", [(True, "restart-done"), (False, "restart-failed")])
+def test_finish(success, marker, harness):
+    """Test that finished restart releases the grant of the unit."""
+    unit_name = harness.charm.unit.name
+    with harness.hooks_disabled():
+        restarts = setup_rolling_restart(
+            harness, {unit_name: {"restart-requested": "a"}}, [unit_name]
+        )
+
+    restarts.finish("a", success)
+
+    assert restarts.relation.data[restarts.unit][marker] == "a"
+    assert restarts.granted_restart() is None